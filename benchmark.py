@@ -0,0 +1,239 @@
+import argparse
+import json
+import numpy
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import ddr
+
+################
+# SYNTHETIC CHART START
+################
+
+SYNTHETIC_BEATS_PER_MEASURE = 4
+SYNTHETIC_BPM_MIN = 80
+SYNTHETIC_BPM_MAX = 300
+SYNTHETIC_STOP_SECONDS_MIN = 0.05
+SYNTHETIC_STOP_SECONDS_MAX = 0.5
+SYNTHETIC_HOLD_ROWS_MIN_MEASURE_FRACTION = 1/16
+SYNTHETIC_HOLD_ROWS_MAX_MEASURE_FRACTION = 2
+SYNTHETIC_MUSIC_FILENAME = 'synthetic.wav'
+SYNTHETIC_CREDIT = 'https://example.com/synthetic' # Values may contain [//], which must not start a comment there
+SYNTHETIC_MUSIC_FRAME_RATE = 22050
+SYNTHETIC_MUSIC_SECONDS = 1 # Only has to be loadable, since the startup benchmark quits after the first frame
+
+# Notes are placed on random rows of [rows_per_measure] rows, so 192 rows per measure yields every quantization up to 192nds.
+# Notes that would overlap a hold in the same lane are dropped, so there may be slightly fewer notes than requested.
+def generate_simfile(file_format, measure_count, notes_per_measure, rows_per_measure=192, hold_count=0, mine_count=0, bpm_change_count=0, stop_count=0, seed=0):
+    rng = random.Random(seed)
+    beat_count = measure_count * SYNTHETIC_BEATS_PER_MEASURE
+    beats_per_minute_assignments = [(0, rng.uniform(SYNTHETIC_BPM_MIN, SYNTHETIC_BPM_MAX))] + [(beat, rng.uniform(SYNTHETIC_BPM_MIN, SYNTHETIC_BPM_MAX)) for beat in sorted(rng.sample(range(1, beat_count), bpm_change_count))]
+    stop_assignments = [(beat, rng.uniform(SYNTHETIC_STOP_SECONDS_MIN, SYNTHETIC_STOP_SECONDS_MAX)) for beat in sorted(rng.sample(range(1, beat_count), stop_count))]
+    rows = generate_rows(rng, measure_count, notes_per_measure, rows_per_measure, hold_count, mine_count)
+    measures = ['\n'.join(rows[measure_index*rows_per_measure:(measure_index+1)*rows_per_measure]) for measure_index in range(measure_count)]
+    notes = '\n,\n'.join(measures)
+    beats_per_minute = ','.join(f'{beat:.3f}={beats_per_minute:.3f}' for beat, beats_per_minute in beats_per_minute_assignments)
+    stops = ','.join(f'{beat:.3f}={seconds:.3f}' for beat, seconds in stop_assignments)
+    header = f'#TITLE:Synthetic;\n#ARTIST:benchmark;\n#CREDIT:{SYNTHETIC_CREDIT};\n#MUSIC:{SYNTHETIC_MUSIC_FILENAME};\n#OFFSET:0.000;\n#BPMS:{beats_per_minute};\n#STOPS:{stops};\n'
+    if file_format == '.ssc':
+        return f'#VERSION:0.83;\n{header}\n#NOTEDATA:;\n#STEPSTYPE:dance-single;\n#DIFFICULTY:Challenge;\n#METER:10;\n#NOTES:\n{notes}\n;\n'
+    elif file_format == '.sm':
+        return f'{header}\n#NOTES:\n     dance-single:\n     :\n     Challenge:\n     10:\n     0,0,0,0,0:\n{notes}\n;\n'
+    else:
+        assert False, file_format
+
+def write_silent_music(filepath):
+    with wave.open(filepath, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SYNTHETIC_MUSIC_FRAME_RATE)
+        f.writeframes(bytes(2 * SYNTHETIC_MUSIC_FRAME_RATE * SYNTHETIC_MUSIC_SECONDS))
+
+def generate_rows(rng, measure_count, notes_per_measure, rows_per_measure, hold_count, mine_count):
+    row_count = measure_count * rows_per_measure
+    grid = [[ddr.DDR_BEAT_VARIANT_NONE] * ddr.DDR_BEATS_PER_ROW for _ in range(row_count)]
+    note_positions = sorted(rng.sample(range(row_count * ddr.DDR_BEATS_PER_ROW), min(measure_count * notes_per_measure, row_count * ddr.DDR_BEATS_PER_ROW)))
+    special_indices = rng.sample(range(len(note_positions)), min(hold_count + mine_count, len(note_positions)))
+    hold_indices = set(special_indices[:hold_count])
+    mine_indices = set(special_indices[hold_count:])
+    lane_busy_until_rows = [-1] * ddr.DDR_BEATS_PER_ROW
+    for note_index, note_position in enumerate(note_positions):
+        row, lane = divmod(note_position, ddr.DDR_BEATS_PER_ROW)
+        if row <= lane_busy_until_rows[lane]:
+            continue
+        if note_index in hold_indices:
+            hold_end_row = row + rng.randint(max(1, int(rows_per_measure * SYNTHETIC_HOLD_ROWS_MIN_MEASURE_FRACTION)), int(rows_per_measure * SYNTHETIC_HOLD_ROWS_MAX_MEASURE_FRACTION))
+            if hold_end_row < row_count:
+                grid[row][lane] = ddr.DDR_BEAT_VARIANT_HOLD_START
+                grid[hold_end_row][lane] = ddr.DDR_BEAT_VARIANT_HOLD_END
+                lane_busy_until_rows[lane] = hold_end_row
+                continue
+        grid[row][lane] = ddr.DDR_BEAT_VARIANT_MINE if note_index in mine_indices else ddr.DDR_BEAT_VARIANT_DEFAULT
+    return [''.join(row) for row in grid]
+
+################
+# SYNTHETIC CHART END
+################
+
+################
+# BENCHMARK START
+################
+
+BENCHMARK_CASES = {
+    'short': {'measure_count': 32, 'notes_per_measure': 8},
+    'long': {'measure_count': 1000, 'notes_per_measure': 8, 'hold_count': 500, 'mine_count': 200},
+    'dense': {'measure_count': 200, 'notes_per_measure': 64, 'hold_count': 200, 'mine_count': 1000},
+    'timing_changes': {'measure_count': 200, 'notes_per_measure': 8, 'hold_count': 100, 'bpm_change_count': 400, 'stop_count': 300},
+}
+BENCHMARK_FILE_FORMATS = ['.ssc', '.sm']
+BENCHMARK_MEASURE_HEIGHT = ddr.MEASURE_HEIGHT_OPTIONS[ddr.MEASURE_HEIGHT_DEFAULT_INDEX]
+BENCHMARK_REPEAT_DEFAULT = 5
+BENCHMARK_FRAME_COUNT = 600
+BENCHMARK_OUTPUT_FILENAME_DEFAULT = 'benchmark_results.json'
+
+def run_benchmarks(case_names, repeat, is_render_enabled):
+    if is_render_enabled:
+        try:
+            ddr.create_headless_gl_context(ddr.DISPLAY_WIDTH, ddr.DISPLAY_HEIGHT)
+        except Exception as e: # EGL may be missing entirely, or fail in any number of driver-specific ways
+            print(f'⚠️ Skipping the render pass because no headless GL context could be created ({e})...')
+            is_render_enabled = False
+    results = {}
+    with tempfile.TemporaryDirectory() as temporary_dir_filepath:
+        write_silent_music(os.path.join(temporary_dir_filepath, SYNTHETIC_MUSIC_FILENAME))
+        for case_name in case_names:
+            for file_format in BENCHMARK_FILE_FORMATS:
+                simfile_filepath = os.path.join(temporary_dir_filepath, case_name + file_format)
+                with open(simfile_filepath, 'w') as f:
+                    f.write(generate_simfile(file_format, **BENCHMARK_CASES[case_name]))
+                print(f'⏳️ Benchmarking "{case_name}{file_format}"...')
+                results[case_name + file_format] = benchmark_simfile(simfile_filepath, file_format, repeat, is_render_enabled)
+    return {
+        'commit': get_git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+# Every repetition times a freshly parsed song, since songs and beatmaps cache their results
+def benchmark_simfile(simfile_filepath, file_format, repeat, is_render_enabled):
+    def parse_fresh():
+        song = ddr.parse_simfile(simfile_filepath, file_format)
+        return song, song.ddr_beatmap_list()[0]
+
+    song, beatmap = parse_fresh()
+    assert song.header_data()['CREDIT'] == SYNTHETIC_CREDIT and song.music_filename() == SYNTHETIC_MUSIC_FILENAME
+    chart_layout = ddr.ChartLayout.compute(song, beatmap)
+    chart_renderer = ddr.ChartRenderer(chart_layout, measure_height=BENCHMARK_MEASURE_HEIGHT)
+    frame_times = numpy.linspace(0, chart_layout.end_time_seconds(), BENCHMARK_FRAME_COUNT)
+    results = {
+        'file_size': os.path.getsize(simfile_filepath),
+        'note_count': len(chart_layout.beat_array),
+        'stages': {
+            'parse': benchmark_stage(lambda: None, lambda _: ddr.parse_simfile(simfile_filepath, file_format), repeat),
+            'song_sections': benchmark_stage(parse_fresh, lambda song_beatmap: song_beatmap[0].sections(BENCHMARK_MEASURE_HEIGHT), repeat),
+            'ddr_beat_list': benchmark_stage(parse_fresh, lambda song_beatmap: song_beatmap[1].ddr_beat_list(), repeat),
+            'chart_layout_compute': benchmark_stage(parse_fresh, lambda song_beatmap: ddr.ChartLayout.compute(*song_beatmap), repeat),
+            'startup': benchmark_stage(lambda: None, lambda _: run_until_first_frame(simfile_filepath), repeat),
+        },
+        'frames': {
+            'displayed_beats': benchmark_frames(chart_renderer._visible_beats_at_time, frame_times),
+        },
+    }
+    if is_render_enabled:
+        results['frames']['render'] = benchmark_frames(lambda frame_time: (chart_renderer.render(frame_time), ddr.glFinish()), frame_times)
+        for chart_renderer_name, chart_renderer_class in ddr.CHART_RENDERER_CLASSES.items():
+            if chart_renderer_name == ddr.CHART_RENDERER_DEFAULT:
+                continue
+            other_chart_renderer = chart_renderer_class(chart_layout, measure_height=BENCHMARK_MEASURE_HEIGHT)
+            results['frames'][f'render_{chart_renderer_name}'] = benchmark_frames(lambda frame_time: (other_chart_renderer.render(frame_time), ddr.glFinish()), frame_times)
+        # Draws into an offscreen surface, which is what the pygame window draws into as well (minus the flip)
+        ddr.import_pygame()
+        sprite_chart_renderer = ddr.SpriteChartRenderer(chart_layout, ddr.pygame.Surface((ddr.DISPLAY_WIDTH, ddr.DISPLAY_HEIGHT)), measure_height=BENCHMARK_MEASURE_HEIGHT)
+        results['frames']['render_sprite_atlas'] = benchmark_frames(sprite_chart_renderer.render, frame_times)
+    return results
+
+def benchmark_stage(setup, run, repeat):
+    durations_seconds = []
+    for _ in range(repeat):
+        argument = setup()
+        start_time = time.perf_counter()
+        run(argument)
+        durations_seconds.append(time.perf_counter() - start_time)
+    return {
+        'min_ms': min(durations_seconds) * ddr.MILLISECONDS_IN_SECONDS,
+        'median_ms': float(numpy.median(durations_seconds)) * ddr.MILLISECONDS_IN_SECONDS,
+    }
+
+# From process start to the first frame of the chart, through the pygame backend so that it runs headlessly with SDL's
+# dummy drivers. The chart layout is cached by the first run, like it is after a song is played once.
+def run_until_first_frame(simfile_filepath):
+    subprocess.run([sys.executable, ddr.__file__, simfile_filepath, '--backend', 'pygame', '--quit-after-first-frame'], env=dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy'), capture_output=True, check=True)
+
+def benchmark_frames(run_frame, frame_times):
+    durations_seconds = []
+    for frame_time in frame_times:
+        start_time = time.perf_counter()
+        run_frame(frame_time)
+        durations_seconds.append(time.perf_counter() - start_time)
+    return {
+        'frame_count': len(frame_times),
+        'median_ms': float(numpy.median(durations_seconds)) * ddr.MILLISECONDS_IN_SECONDS,
+        'p99_ms': float(numpy.percentile(durations_seconds, 99)) * ddr.MILLISECONDS_IN_SECONDS,
+        'total_ms': sum(durations_seconds) * ddr.MILLISECONDS_IN_SECONDS,
+    }
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Prints the ratio of every timing to the same timing in [baseline_report], so < 1 is an improvement
+def print_comparison(report, baseline_report):
+    print(f'📊 Compared to {baseline_report["commit"]}:')
+    for simfile_name, results in report['results'].items():
+        baseline_results = baseline_report['results'].get(simfile_name)
+        if not baseline_results:
+            continue
+        for group_name, timing_key in [('stages', 'median_ms'), ('frames', 'median_ms')]:
+            for stage_name, timing in results[group_name].items():
+                baseline_timing = baseline_results[group_name].get(stage_name)
+                if baseline_timing and baseline_timing[timing_key] > 0:
+                    print(f'    {simfile_name} {stage_name}: {timing[timing_key]:.3f}ms vs {baseline_timing[timing_key]:.3f}ms ({timing[timing_key] / baseline_timing[timing_key]:.2f}x)')
+
+################
+# BENCHMARK END
+################
+
+################
+# MAIN START
+################
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Benchmarks the hot paths of D/DR on synthetic charts.')
+    argument_parser.add_argument('--cases', nargs='+', choices=list(BENCHMARK_CASES), default=list(BENCHMARK_CASES))
+    argument_parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT_DEFAULT)
+    argument_parser.add_argument('--no-render', action='store_true', help='skip the headless render pass')
+    argument_parser.add_argument('--output', default=BENCHMARK_OUTPUT_FILENAME_DEFAULT)
+    argument_parser.add_argument('--compare', help='previous results to compare against')
+    arguments = argument_parser.parse_args()
+
+    report = run_benchmarks(arguments.cases, arguments.repeat, not arguments.no_render)
+    with open(arguments.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'✅ Results saved to {arguments.output}')
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            print_comparison(report, json.load(f))
+
+################
+# MAIN END
+################
@@ -1,15 +1,153 @@
 import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = ''
 
-from OpenGL.GL import *
-from OpenGL.GLU import *
-from OpenGL.GLUT import *
+import time
+STARTUP_PERF_TIME = time.perf_counter() # As early as possible, so that the time to the first frame covers every import
 
+import abc
+import argparse
+import concurrent.futures
+import contextlib
+import ctypes
 import enum
+import gc
+import hashlib
+import importlib
+import json
 import math
-import pick
-import pygame
-import time
+import mmap
+import numpy
+import sqlite3
+import sys
+import threading
+import wave
+
+# OpenGL and pygame are most of the import time, but are only needed once a window or a GL context is created, so
+# they are imported then. OpenGL is imported into this module's globals, as its star imports used to.
+pygame = None # Imported by [import_pygame]
+NullFunctionError = None # Imported by [import_gl], along with everything from [GL_STAR_IMPORT_MODULE_NAMES]
+GL_STAR_IMPORT_MODULE_NAMES = ['OpenGL.GL', 'OpenGL.GLU', 'OpenGL.GLUT']
+
+def import_pygame():
+    global pygame
+    pygame = importlib.import_module('pygame')
+
+def import_gl():
+    global NullFunctionError
+    if NullFunctionError:
+        return
+    for module_name in GL_STAR_IMPORT_MODULE_NAMES:
+        module = importlib.import_module(module_name)
+        globals().update((name, getattr(module, name)) for name in getattr(module, '__all__', [name for name in vars(module) if not name.startswith('_')]))
+    NullFunctionError = importlib.import_module('OpenGL.error').NullFunctionError
+
+################
+# PROFILING START
+################
+
+PROFILE_ENV_VAR = 'DDR_PROFILE' # Profiling is enabled when this environment variable is set to anything but an empty string
+PROFILE_REPORT_FILENAME = 'profile_report.json'
+PROFILE_FRAME_TIME_PERCENTILES = [50, 95, 99]
+PROFILE_FRAME_TIME_HISTOGRAM_BIN_EDGES_MS = [0, 1, 2, 4, 8, 16.7, 33.3, 50, 100, math.inf]
+PROFILE_HUD_FRAME_COUNT = 120 # The HUD only summarizes the most recent frames
+
+class Profiler:
+    enabled = True
+
+    def __init__(self):
+        self._timer_durations_seconds = {}
+        self._frame_durations_seconds = []
+        self._frame_note_counts = []
+        self._frame_start_perf_time = None
+
+    def timer(self, name):
+        return ProfilerTimer(self, name)
+
+    def add_timer_duration(self, name, duration_seconds):
+        self._timer_durations_seconds.setdefault(name, []).append(duration_seconds)
+
+    def frame_started(self):
+        self._frame_start_perf_time = time.perf_counter()
+
+    def frame_ended(self, note_count):
+        self._frame_durations_seconds.append(time.perf_counter() - self._frame_start_perf_time)
+        self._frame_note_counts.append(note_count)
+
+    def hud_lines(self):
+        frame_durations_ms = numpy.array(self._frame_durations_seconds[-PROFILE_HUD_FRAME_COUNT:]) * MILLISECONDS_IN_SECONDS
+        if len(frame_durations_ms) == 0:
+            return []
+        frame_time_percentiles_ms = numpy.percentile(frame_durations_ms, PROFILE_FRAME_TIME_PERCENTILES)
+        return [
+            'frame time ' + ' '.join(f'p{percentile} {frame_time_ms:.2f}ms' for percentile, frame_time_ms in zip(PROFILE_FRAME_TIME_PERCENTILES, frame_time_percentiles_ms)),
+            f'notes {self._frame_note_counts[-1]}',
+        ]
+
+    def report(self):
+        frame_durations_ms = numpy.array(self._frame_durations_seconds) * MILLISECONDS_IN_SECONDS
+        frame_note_counts = numpy.array(self._frame_note_counts)
+        report = {
+            'timers': {
+                name: {
+                    'count': len(durations_seconds),
+                    'total_ms': sum(durations_seconds) * MILLISECONDS_IN_SECONDS,
+                    'max_ms': max(durations_seconds) * MILLISECONDS_IN_SECONDS,
+                }
+                for name, durations_seconds in self._timer_durations_seconds.items()
+            },
+            'frame_count': len(frame_durations_ms),
+        }
+        if len(frame_durations_ms) > 0:
+            histogram_counts, _ = numpy.histogram(frame_durations_ms, bins=PROFILE_FRAME_TIME_HISTOGRAM_BIN_EDGES_MS)
+            report['frame_time_ms'] = {
+                **{f'p{percentile}': float(frame_time_ms) for percentile, frame_time_ms in zip(PROFILE_FRAME_TIME_PERCENTILES, numpy.percentile(frame_durations_ms, PROFILE_FRAME_TIME_PERCENTILES))},
+                'mean': float(frame_durations_ms.mean()),
+                'max': float(frame_durations_ms.max()),
+                'histogram': [
+                    {'min_ms': bin_min_ms, 'max_ms': bin_max_ms if bin_max_ms != math.inf else None, 'count': int(count)}
+                    for bin_min_ms, bin_max_ms, count in zip(PROFILE_FRAME_TIME_HISTOGRAM_BIN_EDGES_MS, PROFILE_FRAME_TIME_HISTOGRAM_BIN_EDGES_MS[1:], histogram_counts)
+                ],
+            }
+            report['notes_per_frame'] = {
+                'mean': float(frame_note_counts.mean()),
+                'max': int(frame_note_counts.max()),
+            }
+        return report
+
+    def save_report(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+class ProfilerTimer:
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start_perf_time = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.add_timer_duration(self._name, time.perf_counter() - self._start_perf_time)
+
+# Stands in for [Profiler] when profiling is disabled, so instrumented code only pays for a method call
+class NullProfiler:
+    enabled = False
+    _null_timer = contextlib.nullcontext()
+
+    def timer(self, name):
+        return self._null_timer
+
+    def frame_started(self):
+        pass
+
+    def frame_ended(self, note_count):
+        pass
+
+profiler = Profiler() if os.environ.get(PROFILE_ENV_VAR) else NullProfiler()
+
+################
+# PROFILING END
+################
 
 ################
 # SONG START
@@ -22,6 +160,13 @@ DDR_BEAT_VARIANT_HOLD_START = '2'
 DDR_BEAT_VARIANT_HOLD_END = '3'
 DDR_BEAT_VARIANT_ROLL_START = '4'
 DDR_BEAT_VARIANT_MINE = 'M'
+DDR_BEAT_MEASURE_SEPARATOR = ','
+DDR_BEAT_QUANTIZATIONS = [4, 8, 6, 12] # Beats that do not fall on any of these are colored as the next index
+
+ANALYTICS_STREAM_MAX_GAP_MEASURES = 1/16 # Consecutive steps at least as fast as 16th notes are part of a stream
+ANALYTICS_STREAM_MIN_STEP_COUNT = 8
+ANALYTICS_PEAK_WINDOW_SECONDS = 1
+ANALYTICS_MEASURE_TIME_TOLERANCE = 1e-6
 
 class Song:
     def __init__(self, header_data, beatmap_list):
@@ -29,7 +174,13 @@ class Song:
         self._beatmap_list = beatmap_list
         self._cached_beats_per_minute = None
         self._cached_stops = None
-        self._cached_sections = None
+        self._cached_sections = dict() # By measure height
+
+    def header_data(self):
+        return self._header_data
+
+    def beatmap_list(self):
+        return self._beatmap_list
 
     def displayed_name(self):
         return f'{self._header_data["TITLE"]} ({self._header_data["ARTIST"]}) · {self._displayed_beats_per_minute()} BPM'
@@ -65,9 +216,11 @@ class Song:
         return beats_per_minute
 
     def _get_beats_per_minute(self):
+        if 'BPMS' not in self._header_data:
+            raise ParseError('#BPMS is missing')
         beats_per_minute_assignments = parse_comma_separated_assignments(self._header_data['BPMS'])
-        assert(len(beats_per_minute_assignments) > 0)
-        assert(float(beats_per_minute_assignments[0][0]) == 0)
+        if len(beats_per_minute_assignments) == 0 or beats_per_minute_assignments[0][0] != 0:
+            raise ParseError(f'#BPMS does not start at beat 0 ({self._header_data["BPMS"]})')
         return beats_per_minute_assignments
 
     def beats_per_minute_min_max(self):
@@ -83,10 +236,12 @@ class Song:
         if 'TIMESIGNATURES' not in self._header_data:
             return 4 # This is the default if not specified
         # TODO: Handle songs that have non 4-4 time signatures
-        time_signatures_data = self._header_data['TIMESIGNATURES'].split('=')
-        assert(float(time_signatures_data[0]) == 0)
-        assert(float(time_signatures_data[1]) == 4)
-        assert(float(time_signatures_data[2]) == 4)
+        try:
+            time_signature = [float(value) for value in self._header_data['TIMESIGNATURES'].split('=')]
+        except ValueError:
+            time_signature = None # Several time signatures
+        if time_signature != [0, 4, 4]:
+            raise ParseError(f'Only a single 4-4 time signature is supported (#TIMESIGNATURES:{self._header_data["TIMESIGNATURES"]})')
         return 4
 
     def _stops(self):
@@ -97,14 +252,16 @@ class Song:
         return stops
 
     def _get_stops(self):
+        if 'STOPS' not in self._header_data:
+            return [] # Songs without stops may leave out the header entirely
         stops_assignments = parse_comma_separated_assignments(self._header_data['STOPS'])
         return stops_assignments
 
     def sections(self, measure_height):
-        if self._cached_sections:
-            return self._cached_sections
+        if measure_height in self._cached_sections:
+            return self._cached_sections[measure_height]
         sections = self._get_sections(measure_height)
-        self._cached_sections = sections
+        self._cached_sections[measure_height] = sections
         return sections
 
     def _get_sections(self, measure_height):
@@ -138,11 +295,54 @@ class Song:
             sections.append(section)
         return sections
 
+    def timing(self, measure_height):
+        with profiler.timer('song_sections'):
+            sections = self.sections(measure_height)
+        return SongTiming.from_sections(sections=sections, beats_per_measure=self.beats_per_measure(), measure_height=measure_height)
+
     def ddr_beatmap_list(self):
         ddr_beatmap_list = [beatmap for beatmap in self._beatmap_list if beatmap.is_ddr_beatmap()]
         ddr_beatmap_list.sort(key=lambda beatmap: beatmap.difficulty_int())
         return ddr_beatmap_list
 
+    # Plain data, so it can be stored in song records. Steps are rows with at least one arrow (mines and hold ends are
+    # not steps), and jumps are steps with more than one arrow.
+    def beatmap_analytics(self, beatmap):
+        beat_array = beatmap.ddr_beat_array()
+        is_mine = beat_array.variant_codes == ord(DDR_BEAT_VARIANT_MINE)
+        is_step_note = ~is_mine & (beat_array.variant_codes != ord(DDR_BEAT_VARIANT_HOLD_END))
+        step_measure_times, step_note_counts = numpy.unique(beat_array.measure_times[is_step_note], return_counts=True)
+        step_times_seconds = numpy.asarray(self.timing(measure_height=1).time_until_pixel_distance(step_measure_times))
+        stream_step_counts = get_stream_step_counts(step_measure_times)
+        if len(step_times_seconds) > 1 and step_times_seconds[-1] > step_times_seconds[0]:
+            average_notes_per_second = len(step_times_seconds) / (step_times_seconds[-1] - step_times_seconds[0])
+        else:
+            average_notes_per_second = 0
+        if len(step_times_seconds) > 0:
+            peak_notes_per_second = int((numpy.searchsorted(step_times_seconds, step_times_seconds + ANALYTICS_PEAK_WINDOW_SECONDS, side='left') - numpy.arange(len(step_times_seconds))).max()) / ANALYTICS_PEAK_WINDOW_SECONDS
+        else:
+            peak_notes_per_second = 0
+        return {
+            'average_notes_per_second': float(average_notes_per_second),
+            'peak_notes_per_second': float(peak_notes_per_second),
+            'step_count': len(step_measure_times),
+            'stream_count': int((stream_step_counts >= ANALYTICS_STREAM_MIN_STEP_COUNT).sum()),
+            'longest_stream_step_count': int(stream_step_counts.max()) if len(stream_step_counts) > 0 else 0,
+            'jump_count': int((step_note_counts > 1).sum()),
+            'hold_count': int((beat_array.hold_end_indices >= 0).sum()),
+            'mine_count': int(is_mine.sum()),
+            'beats_per_minute_change_count': len(self._beats_per_minute()) - 1,
+            'stop_count': len(self._stops()),
+        }
+
+# Number of steps of every run of steps that are no further apart than [ANALYTICS_STREAM_MAX_GAP_MEASURES]
+def get_stream_step_counts(step_measure_times):
+    if len(step_measure_times) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    is_run_break = numpy.diff(step_measure_times) > ANALYTICS_STREAM_MAX_GAP_MEASURES + ANALYTICS_MEASURE_TIME_TOLERANCE
+    run_start_indices = numpy.concatenate(([0], numpy.flatnonzero(is_run_break) + 1))
+    return numpy.diff(numpy.append(run_start_indices, len(step_measure_times)))
+
 class SongSection:
     def __init__(self, time_seconds, beats_per_minute, is_stopped, accumulated_pixel_distance_start):
         self.time_seconds = time_seconds
@@ -151,20 +351,80 @@ class SongSection:
         self.accumulated_pixel_distance_start = accumulated_pixel_distance_start
 
     def pixel_distance_until_time(self, end_time_seconds, beats_per_measure, measure_height):
+        return (end_time_seconds - self.time_seconds) * self.pixels_per_second(beats_per_measure, measure_height)
+
+    def pixels_per_second(self, beats_per_measure, measure_height):
         if self.is_stopped:
             return 0
         else:
-            return (end_time_seconds - self.time_seconds) * (self.beats_per_minute / SECONDS_IN_MINUTE) / beats_per_measure * measure_height
+            return (self.beats_per_minute / SECONDS_IN_MINUTE) / beats_per_measure * measure_height
+
+# Maps song time to scroll distance using a table of the song's sections (one array per column)
+class SongTiming:
+    def __init__(self, section_start_times_seconds, section_pixels_per_second, section_accumulated_pixel_distances):
+        assert(len(section_start_times_seconds) > 0)
+        self.section_start_times_seconds = section_start_times_seconds
+        self.section_pixels_per_second = section_pixels_per_second
+        self.section_accumulated_pixel_distances = section_accumulated_pixel_distances
+
+    @classmethod
+    def from_sections(cls, sections, beats_per_measure, measure_height):
+        return cls(
+            section_start_times_seconds=numpy.array([section.time_seconds for section in sections], dtype=numpy.float64),
+            section_pixels_per_second=numpy.array([section.pixels_per_second(beats_per_measure, measure_height) for section in sections], dtype=numpy.float64),
+            section_accumulated_pixel_distances=numpy.array([section.accumulated_pixel_distance_start for section in sections], dtype=numpy.float64),
+        )
+
+    def pixel_distance_until_time(self, time_seconds):
+        # Times before the first section are extrapolated from the first section
+        section_index = max(numpy.searchsorted(self.section_start_times_seconds, time_seconds, side='right') - 1, 0)
+        return self.section_accumulated_pixel_distances[section_index] + (time_seconds - self.section_start_times_seconds[section_index]) * self.section_pixels_per_second[section_index]
+
+    # Inverse of [pixel_distance_until_time]; the earliest time at which [pixel_distance] is reached.
+    # Also takes an array of pixel distances.
+    def time_until_pixel_distance(self, pixel_distance):
+        section_index = numpy.maximum(numpy.searchsorted(self.section_accumulated_pixel_distances, pixel_distance, side='left') - 1, 0)
+        section_pixels_per_second = self.section_pixels_per_second[section_index]
+        with numpy.errstate(divide='ignore', invalid='ignore'): # Stopped sections are only reached at their start
+            return self.section_start_times_seconds[section_index] + numpy.where(section_pixels_per_second == 0, 0, (pixel_distance - self.section_accumulated_pixel_distances[section_index]) / section_pixels_per_second)
 
 class Beatmap:
-    def __init__(self, title_line, data):
+    # [data] omits 'NOTES' for lazily parsed charts, whose notes are instead read from [notes_byte_range] of the
+    # simfile once they are actually needed
+    def __init__(self, title_line, data, simfile_filepath=None, notes_byte_range=None, analytics=None):
         self._title_line = title_line
         self._data = data
+        self._simfile_filepath = simfile_filepath
+        self._notes_byte_range = notes_byte_range
+        self._analytics = analytics # See [Song.beatmap_analytics], only known for charts listed from the library
+        self._cached_ddr_beat_array = None
         self._cached_ddr_beat_list = None
 
+    def title_line(self):
+        return self._title_line
+
+    def metadata(self):
+        return {label: value for label, value in self._data.items() if label != 'NOTES'}
+
+    def notes_byte_range(self):
+        return self._notes_byte_range
+
+    def simfile_filepath(self):
+        return self._simfile_filepath
+
     def displayed_difficulty(self):
         return f'{self._data["DIFFICULTY"]} ({self._data["METER"]})'
 
+    def analytics(self):
+        return self._analytics
+
+    def displayed_analytics(self):
+        if not self._analytics:
+            return None
+        analytics = self._analytics
+        displayed_timing_changes = f' · {analytics["beats_per_minute_change_count"]} BPM changes, {analytics["stop_count"]} stops' if analytics['beats_per_minute_change_count'] or analytics['stop_count'] else ''
+        return f'{analytics["average_notes_per_second"]:.1f} NPS (peak {analytics["peak_notes_per_second"]:.0f}) · {analytics["stream_count"]} streams (longest {analytics["longest_stream_step_count"]}) · {analytics["jump_count"]} jumps · {analytics["hold_count"]} holds · {analytics["mine_count"]} mines{displayed_timing_changes}'
+
     def difficulty_int(self):
         return int(self._data['METER'])
 
@@ -179,47 +439,123 @@ class Beatmap:
             return float(self._data['OFFSET'])
         return None
 
+    def ddr_beat_array(self):
+        if self._cached_ddr_beat_array is not None:
+            return self._cached_ddr_beat_array
+        with profiler.timer('notes_decode'):
+            ddr_beat_array = BeatArray.from_notes(self.notes())
+        self._cached_ddr_beat_array = ddr_beat_array
+        return ddr_beat_array
+
+    def notes(self):
+        if 'NOTES' in self._data:
+            return self._data['NOTES']
+        return read_simfile_value(self._simfile_filepath, self._notes_byte_range, is_notes=True)
+
     def ddr_beat_list(self):
         if self._cached_ddr_beat_list:
             return self._cached_ddr_beat_list
-        ddr_beat_list = self._get_ddr_beat_list()
+        ddr_beat_array = self.ddr_beat_array()
+        ddr_beat_list = [Beat(beat_array=ddr_beat_array, index=index) for index in range(len(ddr_beat_array))]
         self._cached_ddr_beat_list = ddr_beat_list
         return ddr_beat_list
 
-    def _get_ddr_beat_list(self):
-        measures = self._data['NOTES'].split(',')
-        ddr_beat_list = []
-        for measure_index, measure in enumerate(measures):
-            rows = [measure[i:i+DDR_BEATS_PER_ROW] for i in range(0, len(measure), DDR_BEATS_PER_ROW)]
-            for row_index, row in enumerate(rows):
-                for i in range(DDR_BEATS_PER_ROW):
-                    if row[i] != DDR_BEAT_VARIANT_NONE:
-                        ddr_beat_list.append(Beat(
-                            measure_time=measure_index+row_index/len(rows),
-                            rgb=self._get_ddr_beat_rgb(row_index, len(rows)),
-                            direction=BeatDirection(i),
-                            variant=row[i],
-                        ))
-        return ddr_beat_list
-
-    def _get_ddr_beat_rgb(self, beat_within_measure, total_beats_in_measure):
-        if (4*beat_within_measure) % total_beats_in_measure == 0:
-            return RED_RGB
-        elif (8*beat_within_measure) % total_beats_in_measure == 0:
-            return BLUE_RGB
-        elif (6*beat_within_measure) % total_beats_in_measure == 0:
-            return GREEN_RGB
-        elif (12*beat_within_measure) % total_beats_in_measure == 0:
-            return PURPLE_RGB
-        else:
-            return WHITE_RGB
+# Notes of a beatmap are stored column-wise (one array per attribute, indexed by beat) instead of as
+# one [Beat] object per note, which is much cheaper to build and to hold in memory for large charts
+class BeatArray:
+    def __init__(self, measure_times, directions, variant_codes, color_indices, hold_end_indices):
+        self.measure_times = measure_times # float64, sorted
+        self.directions = directions # uint8, [BeatDirection] values
+        self.variant_codes = variant_codes # uint8, ordinals of the [DDR_BEAT_VARIANT_*] characters
+        self.color_indices = color_indices # uint8, indices into [DDR_BEAT_QUANTIZATION_RGBS]
+        self.hold_end_indices = hold_end_indices # int32, index of the paired hold end for hold/roll starts, otherwise -1
+
+    def __len__(self):
+        return len(self.measure_times)
+
+    @classmethod
+    def from_notes(cls, notes):
+        characters = numpy.frombuffer(notes.encode(), dtype=numpy.uint8)
+        characters = characters[~numpy.isin(characters, numpy.frombuffer(b' \t\r\n', dtype=numpy.uint8))]
+        is_measure_separator = characters == ord(DDR_BEAT_MEASURE_SEPARATOR)
+        character_measure_indices = numpy.cumsum(is_measure_separator)[~is_measure_separator]
+        characters = characters[~is_measure_separator]
+
+        measure_lengths = numpy.bincount(character_measure_indices, minlength=numpy.count_nonzero(is_measure_separator)+1)
+        measure_starts = numpy.cumsum(measure_lengths) - measure_lengths
+        character_offsets = numpy.arange(len(characters)) - measure_starts[character_measure_indices]
+        character_row_indices = character_offsets // DDR_BEATS_PER_ROW
+        character_total_rows = -(-measure_lengths[character_measure_indices] // DDR_BEATS_PER_ROW)
+
+        is_beat = characters != ord(DDR_BEAT_VARIANT_NONE)
+        measure_indices = character_measure_indices[is_beat]
+        row_indices = character_row_indices[is_beat]
+        total_rows = character_total_rows[is_beat]
+        color_indices = numpy.select(
+            [(quantization*row_indices) % total_rows == 0 for quantization in DDR_BEAT_QUANTIZATIONS],
+            range(len(DDR_BEAT_QUANTIZATIONS)),
+            default=len(DDR_BEAT_QUANTIZATIONS),
+        )
+        measure_times = measure_indices + row_indices/total_rows
+        directions = (character_offsets[is_beat] % DDR_BEATS_PER_ROW).astype(numpy.uint8)
+        variant_codes = characters[is_beat]
+        return cls(
+            measure_times=measure_times,
+            directions=directions,
+            variant_codes=variant_codes,
+            color_indices=color_indices.astype(numpy.uint8),
+            hold_end_indices=cls._get_hold_end_indices(measure_times, directions, variant_codes),
+        )
 
+    # Hold and roll starts are paired with their end notes once, with a single pass over each lane
+    @staticmethod
+    def _get_hold_end_indices(measure_times, directions, variant_codes):
+        hold_end_indices = numpy.full(len(directions), -1, dtype=numpy.int32)
+        is_hold_start = (variant_codes == ord(DDR_BEAT_VARIANT_HOLD_START)) | (variant_codes == ord(DDR_BEAT_VARIANT_ROLL_START))
+        is_hold_event = is_hold_start | (variant_codes == ord(DDR_BEAT_VARIANT_HOLD_END))
+        for direction in BeatDirection:
+            open_hold_start_index = None
+            for index in numpy.flatnonzero(is_hold_event & (directions == direction.value)):
+                if is_hold_start[index]:
+                    if open_hold_start_index is not None:
+                        raise ParseError(f'{direction.name} hold at measure {measure_times[open_hold_start_index]:.3f} is not terminated before the next hold starts')
+                    open_hold_start_index = index
+                elif open_hold_start_index is not None:
+                    hold_end_indices[open_hold_start_index] = index
+                    open_hold_start_index = None
+            if open_hold_start_index is not None:
+                raise ParseError(f'{direction.name} hold at measure {measure_times[open_hold_start_index]:.3f} is never terminated')
+        return hold_end_indices
+
+# Read-only view of a single note within a [BeatArray]
 class Beat:
-    def __init__(self, measure_time, rgb, direction, variant):
-        self.measure_time = measure_time
-        self.rgb = rgb
-        self.direction = direction
-        self.variant = variant
+    __slots__ = ('_beat_array', '_index')
+
+    def __init__(self, beat_array, index):
+        self._beat_array = beat_array
+        self._index = index
+
+    @property
+    def measure_time(self):
+        return float(self._beat_array.measure_times[self._index])
+
+    @property
+    def rgb(self):
+        return DDR_BEAT_QUANTIZATION_RGBS[self._beat_array.color_indices[self._index]]
+
+    @property
+    def direction(self):
+        return BEAT_DIRECTIONS[self._beat_array.directions[self._index]]
+
+    @property
+    def variant(self):
+        return chr(self._beat_array.variant_codes[self._index])
+
+    def hold_end(self):
+        hold_end_index = self._beat_array.hold_end_indices[self._index]
+        if hold_end_index < 0:
+            return None
+        return Beat(beat_array=self._beat_array, index=hold_end_index)
 
 class BeatDirection(enum.Enum):
     LEFT = 0
@@ -227,6 +563,8 @@ class BeatDirection(enum.Enum):
     UP = 2
     RIGHT = 3
 
+BEAT_DIRECTIONS = list(BeatDirection) # Indexed by [BeatDirection] value
+
 ################
 # SONG END
 ################
@@ -235,132 +573,452 @@ class BeatDirection(enum.Enum):
 # PARSING START
 ################
 
-PYTHON_BOM_CHARACTER_ORD = 65279
+UTF8_BOM = b'\xef\xbb\xbf'
+COMMENT_START = b'//'
+NEXT_HASHTAG_LINE_START = b'\n#' # Ends a value that is missing its semicolon, like StepMania does
+NOTES_LABEL = 'NOTES'
+SM_BEATMAP_METADATA_FIELD_COUNT = 5
 
-def parse(lines, file_format):
-    lines = strip_prefixed_bom_characters(lines)
-    header_data = parse_hashtag_headered(lines)
-    beatmap_list = []
-    while True:
-        maybe_beatmap = parse_beatmap(lines, file_format)
-        if maybe_beatmap:
-            beatmap_list.append(maybe_beatmap)
+class ParseError(Exception):
+    pass
+
+# When [simfile_filepath] is given, the notes of each chart are not decoded; charts only record the byte range
+# of their notes within the simfile, and read them from the file once they are needed
+def parse(buffer, file_format, simfile_filepath=None):
+    header_data = dict()
+    beatmap_data_list = []
+    beatmap_notes_byte_range_list = []
+    for label, value_start, value_end in tokenize_hashtag_pairs(buffer):
+        if file_format == '.ssc':
+            # Every chart starts with a [#NOTEDATA:;] tag, and all tags after it belong to that chart
+            if label == 'NOTEDATA':
+                beatmap_data_list.append({label: decode_value(buffer[value_start:value_end])})
+                beatmap_notes_byte_range_list.append(None)
+            elif len(beatmap_data_list) > 0:
+                if label == 'NOTES' and simfile_filepath:
+                    beatmap_notes_byte_range_list[-1] = (value_start, value_end)
+                else:
+                    beatmap_data_list[-1][label] = decode_value(buffer[value_start:value_end], is_notes=label == NOTES_LABEL)
+            else:
+                header_data[label] = decode_value(buffer[value_start:value_end])
+        elif file_format == '.sm':
+            # Every chart is a single [#NOTES:...;] tag with colon-separated fields, the last of which are the notes
+            if label == 'NOTES':
+                notes_start = get_beatmap_sm_notes_start_index(buffer, value_start, value_end)
+                beatmap_data = parse_beatmap_sm_data(decode_value(buffer[value_start:notes_start], is_notes=True))
+                if simfile_filepath:
+                    beatmap_notes_byte_range_list.append((notes_start, value_end))
+                else:
+                    beatmap_data['NOTES'] = decode_value(buffer[notes_start:value_end], is_notes=True).strip()
+                    beatmap_notes_byte_range_list.append(None)
+                beatmap_data_list.append(beatmap_data)
+            else:
+                header_data[label] = decode_value(buffer[value_start:value_end])
         else:
-            break
+            assert(False)
+    beatmap_list = [
+        Beatmap(
+            title_line=get_beatmap_title_line(beatmap_data),
+            data=beatmap_data,
+            simfile_filepath=simfile_filepath if beatmap_notes_byte_range else None,
+            notes_byte_range=beatmap_notes_byte_range,
+        )
+        for beatmap_data, beatmap_notes_byte_range in zip(beatmap_data_list, beatmap_notes_byte_range_list)
+    ]
     return Song(header_data=header_data, beatmap_list=beatmap_list)
 
-def parse_hashtag_headered(lines):
-    header_data = dict()
-    while len(lines) > 0:
-        line = lines.pop(0).strip('\n')
-        if line == '' or line.startswith('//'):
-            break
-        if line == ';':
+# Scans [buffer] (bytes or a memory-mapped file) once from start to end, yielding the label of every [#LABEL:value;]
+# pair along with the start and end of its value within [buffer]. Comments are skipped, but are still part of the
+# yielded value ranges, so values should be read with [decode_value]. Within values, comments only start at the
+# beginning of a line, except within notes, so that values such as URLs can contain [//].
+def tokenize_hashtag_pairs(buffer):
+    position = len(UTF8_BOM) if buffer[:len(UTF8_BOM)] == UTF8_BOM else 0
+    hashtag_index = -1
+    while True:
+        if hashtag_index < position:
+            hashtag_index = buffer.find(b'#', position)
+            if hashtag_index == -1:
+                return
+        comment_index = buffer.find(COMMENT_START, position, hashtag_index)
+        if comment_index != -1:
+            position = get_end_of_line_index(buffer, comment_index)
             continue
-        header_label = get_hashtag_label(line)
-        assert(line[len(header_label)+1] == ':' or line[len(header_label)+1] == ';')
-        if line[len(header_label)+1] == ';':
-            header_data[header_label] = ''
+
+        label_start = hashtag_index + 1
+        colon_index = buffer.find(b':', label_start)
+        semicolon_index = buffer.find(b';', label_start)
+        if semicolon_index == -1:
+            return
+        if colon_index == -1 or semicolon_index < colon_index:
+            yield decode_value(buffer[label_start:semicolon_index]), semicolon_index, semicolon_index
+            position = semicolon_index + 1
             continue
-        assert(line[len(header_label)+1] == ':')
-        line = line[len(header_label)+2:]
-        if len(line) > 0 and line[-1] == ';':
-            header_data[header_label] = line[:-1]
-        else:
-            while True:
-                addendum_line = lines.pop(0).strip('\n')
-                if len(addendum_line) > 0 and addendum_line[-1] == ';':
-                    line += addendum_line[:-1]
-                    break
-                line += addendum_line
-            header_data[header_label] = line
-    return header_data
-
-def get_hashtag_label(line):
-    assert(line[0] == '#')
-    line = line[1:]
-    colon_index = line.find(':')
-    if colon_index != -1:
-        return line[:colon_index]
-    semicolon_index = line.find(';')
-    assert(semicolon_index != -1)
-    return line[:semicolon_index]
+
+        label = decode_value(buffer[label_start:colon_index])
+        value_start = colon_index + 1
+        position = value_start
+        while True:
+            if semicolon_index < position:
+                semicolon_index = buffer.find(b';', position)
+                if semicolon_index == -1:
+                    semicolon_index = len(buffer)
+            comment_index = find_comment(buffer, position, semicolon_index, is_notes=label == NOTES_LABEL)
+            if comment_index == -1:
+                break
+            position = get_end_of_line_index(buffer, comment_index)
+        next_hashtag_line_index = buffer.find(NEXT_HASHTAG_LINE_START, value_start, semicolon_index)
+        if next_hashtag_line_index != -1:
+            yield label, value_start, next_hashtag_line_index
+            position = next_hashtag_line_index + 1
+            continue
+        yield label, value_start, semicolon_index
+        position = semicolon_index + 1
+
+# Returns the index of the first comment within [start, end), or -1
+def find_comment(buffer, start, end, is_notes):
+    comment_index = buffer.find(COMMENT_START, start, end)
+    if is_notes:
+        return comment_index
+    while comment_index != -1 and not is_line_start(buffer, comment_index):
+        comment_index = buffer.find(COMMENT_START, comment_index + len(COMMENT_START), end)
+    return comment_index
+
+# Whether only whitespace comes before [index] on its line
+def is_line_start(buffer, index):
+    return buffer[buffer.rfind(b'\n', 0, index) + 1:index].strip() == b''
+
+def get_end_of_line_index(buffer, index):
+    end_of_line_index = buffer.find(b'\n', index)
+    return end_of_line_index if end_of_line_index != -1 else len(buffer)
+
+# Removes comments and line breaks
+def decode_value(value, is_notes=False):
+    if COMMENT_START in value:
+        value_chunks = []
+        position = 0
+        while True:
+            comment_index = find_comment(value, position, len(value), is_notes)
+            if comment_index == -1:
+                value_chunks.append(value[position:])
+                break
+            value_chunks.append(value[position:comment_index])
+            position = get_end_of_line_index(value, comment_index)
+        value = b''.join(value_chunks)
+    return value.replace(b'\r', b'').replace(b'\n', b'').decode('utf-8', errors='replace')
+
+def read_simfile_value(simfile_filepath, value_byte_range, is_notes=False):
+    value_start, value_end = value_byte_range
+    with open(simfile_filepath, 'rb') as f:
+        f.seek(value_start)
+        return decode_value(f.read(value_end - value_start), is_notes=is_notes)
 
 def parse_comma_separated_assignments(line):
     sections = line.split(',')
     section_assignments_raw = [section.split('=') for section in sections if section != '']
-    for section_assignment_raw in section_assignments_raw:
-        assert(len(section_assignment_raw) == 2)
-    section_assignments = [(float(section_assignment_raw[0]), float(section_assignment_raw[1])) for section_assignment_raw in section_assignments_raw]
+    try:
+        section_assignments = [(float(section_assignment_raw[0]), float(section_assignment_raw[1])) for section_assignment_raw in section_assignments_raw if len(section_assignment_raw) == 2]
+    except ValueError:
+        section_assignments = None
+    if section_assignments is None or len(section_assignments) != len(section_assignments_raw):
+        raise ParseError(f'Invalid assignments "{line}"')
     section_assignments.sort(key=lambda section_assignment: section_assignment[0])
     return section_assignments
 
-def parse_beatmap(lines, file_format):
+def get_beatmap_title_line(beatmap_data):
+    return f'{beatmap_data.get("STEPSTYPE", "")} - {beatmap_data.get("DESCRIPTION", "")}'
+
+def get_beatmap_sm_notes_start_index(buffer, value_start, value_end):
+    position = value_start
+    for _ in range(SM_BEATMAP_METADATA_FIELD_COUNT):
+        colon_index = find_uncommented(buffer, b':', position, value_end)
+        if colon_index == -1:
+            raise ParseError(f'#NOTES has fewer than {SM_BEATMAP_METADATA_FIELD_COUNT} fields before its notes')
+        position = colon_index + 1
+    if find_uncommented(buffer, b':', position, value_end) != -1:
+        raise ParseError(f'#NOTES has more than {SM_BEATMAP_METADATA_FIELD_COUNT} fields before its notes')
+    return position
+
+# Returns the index of the first [sub] within [start, end) that is not in a comment, or -1
+def find_uncommented(buffer, sub, start, end):
     while True:
-        if len(lines) == 0:
-            return None
-        line = lines.pop(0).strip('\n')
-        if line.startswith('//----'):
-            break
-    beatmap_title_line = line
-
-    beatmap_lines = []
-    while len(lines) > 0:
-        peek_line = lines[0].strip('\n')
-        if peek_line.startswith('//----'):
-            break
-        line = lines.pop(0).strip('\n')
-        beatmap_lines.append(strip_comments(line))
-
-    if file_format == '.ssc':
-        beatmap_data = parse_hashtag_headered(beatmap_lines)
-    elif file_format == '.sm':
-        beatmap_data = parse_beatmap_sm_data(beatmap_lines)
-    else:
-        assert(False)
-
-    return Beatmap(title_line=parse_beatmap_title_line(beatmap_title_line), data=beatmap_data)
-
-def parse_beatmap_title_line(beatmap_title_line):
-    assert(beatmap_title_line.startswith('//'))
-    beatmap_title_line = beatmap_title_line[2:]
-    return beatmap_title_line.strip('-')
-
-def parse_beatmap_sm_data(beatmap_lines):
-    beatmap_data_raw = parse_hashtag_headered(beatmap_lines)
-    assert('NOTES' in beatmap_data_raw)
-    beatmap_data = beatmap_data_raw['NOTES'].split(':')
-    assert(len(beatmap_data) == 6)
+        sub_index = buffer.find(sub, start, end)
+        comment_index = find_comment(buffer, start, end, is_notes=True)
+        if sub_index == -1 or comment_index == -1 or sub_index < comment_index:
+            return sub_index
+        start = get_end_of_line_index(buffer, comment_index)
+
+def parse_beatmap_sm_data(metadata):
+    beatmap_data = metadata.split(':')[:-1]
+    if len(beatmap_data) != SM_BEATMAP_METADATA_FIELD_COUNT:
+        raise ParseError(f'#NOTES has {len(beatmap_data)} fields before its notes instead of {SM_BEATMAP_METADATA_FIELD_COUNT}')
     return {
         'STEPSTYPE': beatmap_data[0].strip(),
         'DESCRIPTION': beatmap_data[1].strip(),
         'DIFFICULTY': beatmap_data[2].strip(),
         'METER': beatmap_data[3].strip(),
         'RADARVALUES': beatmap_data[4].strip(),
-        'NOTES': beatmap_data[5].strip(),
     }
 
-def strip_prefixed_bom_characters(lines):
-    # https://stackoverflow.com/questions/74683953/python-keeps-adding-character-65279-to-the-beginning-of-my-file
-    return [line if ord(line[0]) != PYTHON_BOM_CHARACTER_ORD else line[1:] for line in lines]
+################
+# PARSING END
+################
+
+################
+# PLAYBACK START
+################
 
-def strip_comments(line):
-    comment_start = line.find('//')
-    if comment_start == -1:
-        return line
-    return line[:comment_start].strip()
+PLAYBACK_CLOCK_SMOOTHING = 0.1 # Weight of every new audio position in the smoothed clock error
+PLAYBACK_CLOCK_MAX_SLEW = 0.05 # Corrections are applied at most this many seconds per second, so the clock never jumps
+PLAYBACK_CLOCK_RESYNC_SECONDS = 0.2 # Errors larger than this (e.g. after the audio stalled) are corrected at once
+
+# The audio position is only updated whenever the mixer finishes a buffer, and does not account for the latency
+# between [play()] and the audio actually starting, so using it directly makes notes judder.
+# Instead, the clock runs on [time.perf_counter()], anchored to the audio position once the audio has actually
+# started. Every later update of the audio position is compared against the clock, and the smoothed error is
+# corrected gradually.
+# The audio position is relative to where the audio was last started from, which is passed to [start] when seeking.
+class PlaybackClock:
+    def __init__(self, get_audio_position_seconds):
+        self._get_audio_position_seconds = get_audio_position_seconds
+        self._play_perf_time = None
+        self._error_samples_seconds = []
+        self._resync_count = 0
+
+    def start(self, start_time_seconds=0):
+        perf_time = time.perf_counter()
+        self._play_perf_time = perf_time
+        self._start_time_seconds = start_time_seconds
+        self._anchor_perf_time = perf_time
+        self._anchor_time_seconds = 0
+        self._last_perf_time = perf_time
+        self._last_audio_position_seconds = 0
+        self._smoothed_error_seconds = 0
+        self._latency_seconds = None
+
+    def time_seconds(self):
+        audio_position_seconds = self._get_audio_position_seconds()
+        if self._play_perf_time is None:
+            return audio_position_seconds
+        perf_time = time.perf_counter()
+        if audio_position_seconds != self._last_audio_position_seconds:
+            self._update_audio_position(audio_position_seconds, perf_time)
+        if self._latency_seconds is None: # The audio has not started yet
+            return self._start_time_seconds + audio_position_seconds
+        self._slew(perf_time)
+        return self._start_time_seconds + self._clock_time_seconds(perf_time)
+
+    def _clock_time_seconds(self, perf_time):
+        return self._anchor_time_seconds + (perf_time - self._anchor_perf_time)
+
+    def _update_audio_position(self, audio_position_seconds, perf_time):
+        self._last_audio_position_seconds = audio_position_seconds
+        if self._latency_seconds is None: # The audio has just started
+            self._latency_seconds = (perf_time - self._play_perf_time) - audio_position_seconds
+            self._anchor(audio_position_seconds, perf_time)
+            return
+        error_seconds = audio_position_seconds - self._clock_time_seconds(perf_time)
+        self._error_samples_seconds.append(error_seconds)
+        if abs(error_seconds) > PLAYBACK_CLOCK_RESYNC_SECONDS:
+            self._resync_count += 1
+            self._anchor(audio_position_seconds, perf_time)
+            return
+        self._smoothed_error_seconds += PLAYBACK_CLOCK_SMOOTHING * (error_seconds - self._smoothed_error_seconds)
+
+    def _anchor(self, time_seconds, perf_time):
+        self._anchor_perf_time = perf_time
+        self._anchor_time_seconds = time_seconds
+        self._smoothed_error_seconds = 0
+
+    def _slew(self, perf_time):
+        max_correction_seconds = PLAYBACK_CLOCK_MAX_SLEW * (perf_time - self._last_perf_time)
+        correction_seconds = min(max(self._smoothed_error_seconds, -max_correction_seconds), max_correction_seconds)
+        self._anchor_time_seconds += correction_seconds
+        self._smoothed_error_seconds -= correction_seconds
+        self._last_perf_time = perf_time
+
+    def statistics(self):
+        if self._play_perf_time is None or self._latency_seconds is None:
+            return None
+        error_samples_seconds = numpy.array(self._error_samples_seconds)
+        return {
+            'latency_ms': self._latency_seconds * MILLISECONDS_IN_SECONDS,
+            'jitter_ms': float(error_samples_seconds.std()) * MILLISECONDS_IN_SECONDS if len(error_samples_seconds) > 0 else 0,
+            'mean_error_ms': float(error_samples_seconds.mean()) * MILLISECONDS_IN_SECONDS if len(error_samples_seconds) > 0 else 0,
+            'sample_count': len(error_samples_seconds),
+            'resync_count': self._resync_count,
+        }
+
+PLAYBACK_RATE_OPTIONS = [0.5, 0.6, 0.7, 0.75, 0.8, 0.9, 1.0, 1.1, 1.2, 1.25, 1.3, 1.4, 1.5]
+PLAYBACK_RATE_DEFAULT_INDEX = 6
+TIME_STRETCH_CACHE_DIR_NAME = 'rate_cache'
+TIME_STRETCH_FRAME_LENGTH = 2048 # Samples, overlapped by half
+TIME_STRETCH_SEARCH_TOLERANCE = 512 # Samples that a frame may be moved by to line up with the previous frame
+TIME_STRETCH_BLOCK_FRAME_COUNT = 256 # Frames stretched between progress updates
+
+# Music slowed down or sped up for practice without changing its pitch, stretched on a background thread and cached
+# next to the song, so it is only stretched once per rate
+class TimeStretchedMusic:
+    def __init__(self, music_filepath, rate):
+        self._music_filepath = music_filepath
+        self._rate = rate
+        self._error = None
+        if rate == 1:
+            self._filepath = music_filepath
+            self._progress = 1
+            return
+        self._filepath = get_time_stretch_cache_filepath(music_filepath, rate)
+        if os.path.exists(self._filepath):
+            self._progress = 1
+            return
+        self._progress = 0
+        threading.Thread(target=self._time_stretch, daemon=True).start()
+
+    def filepath(self):
+        return self._filepath
+
+    def progress(self):
+        return self._progress
+
+    def is_ready(self):
+        return self._progress == 1
+
+    def error(self):
+        return self._error
+
+    def _time_stretch(self):
+        try:
+            samples = pygame.sndarray.array(pygame.mixer.Sound(self._music_filepath))
+            frequency, _, channel_count = pygame.mixer.get_init()
+            assert(samples.dtype == numpy.int16)
+            samples = samples.reshape(len(samples), channel_count)
+            remove_stale_time_stretch_caches(self._filepath)
+            os.makedirs(os.path.dirname(self._filepath), exist_ok=True)
+            temporary_filepath = self._filepath + '.tmp'
+            with wave.open(temporary_filepath, 'wb') as f:
+                f.setnchannels(channel_count)
+                f.setsampwidth(samples.itemsize)
+                f.setframerate(frequency)
+                for stretched_samples, progress in time_stretch_blocks(samples, self._rate):
+                    f.writeframes(numpy.clip(stretched_samples, -32768, 32767).astype(numpy.int16).tobytes())
+                    self._progress = min(progress, 0.99)
+            os.replace(temporary_filepath, self._filepath) # Only complete files are ever found in the cache
+            self._progress = 1
+        except Exception as e: # Reported when the song is started at this rate
+            self._error = e
+
+# WSOLA (waveform similarity overlap-add): frames are read [rate] times faster or slower than they are written, and
+# each one is moved by up to [TIME_STRETCH_SEARCH_TOLERANCE] samples to where it best continues the previous frame,
+# which keeps the pitch. Yields the stretched samples in blocks, along with the fraction of the music stretched so far.
+def time_stretch_blocks(samples, rate):
+    frame_length = TIME_STRETCH_FRAME_LENGTH
+    synthesis_hop = frame_length // 2
+    tolerance = TIME_STRETCH_SEARCH_TOLERANCE
+    window = numpy.hanning(frame_length + 1)[:frame_length, numpy.newaxis] # Sums to 1 when overlapped by half
+    padded_samples = numpy.pad(samples.astype(numpy.float32), ((tolerance, frame_length + synthesis_hop + tolerance), (0, 0)))
+    padded_mono_samples = padded_samples.mean(axis=1)
+    correlation_fft_length = 1 << (2 * frame_length + 2 * tolerance - 1).bit_length()
+    output_frame_count = math.ceil(len(samples) / rate / synthesis_hop)
+    overlap_samples = numpy.zeros((frame_length, samples.shape[1]), dtype=numpy.float32)
+    stretched_blocks = []
+    previous_position = None
+    for frame_index in range(output_frame_count):
+        nominal_position = tolerance + int(frame_index * synthesis_hop * rate)
+        if previous_position is None:
+            position = nominal_position
+        else:
+            natural_continuation = padded_mono_samples[previous_position + synthesis_hop:previous_position + synthesis_hop + frame_length]
+            candidates = padded_mono_samples[nominal_position - tolerance:nominal_position + tolerance + frame_length]
+            # Cross-correlation of the natural continuation with every candidate offset
+            correlations = numpy.fft.irfft(numpy.fft.rfft(candidates, correlation_fft_length) * numpy.conj(numpy.fft.rfft(natural_continuation, correlation_fft_length)), correlation_fft_length)[:2 * tolerance + 1]
+            position = nominal_position - tolerance + int(numpy.argmax(correlations))
+        overlap_samples += padded_samples[position:position + frame_length] * window
+        stretched_blocks.append(overlap_samples[:synthesis_hop].copy())
+        overlap_samples = numpy.concatenate((overlap_samples[synthesis_hop:], numpy.zeros_like(overlap_samples[:synthesis_hop])))
+        previous_position = position
+        if len(stretched_blocks) == TIME_STRETCH_BLOCK_FRAME_COUNT or frame_index == output_frame_count - 1:
+            yield numpy.concatenate(stretched_blocks), (frame_index + 1) / output_frame_count
+            stretched_blocks = []
+
+# Cached stretched music is named after the music file's modification time and size, so replacing the music file
+# invalidates it
+def get_time_stretch_cache_filepath(music_filepath, rate):
+    music_stat = os.stat(music_filepath)
+    music_hash = hashlib.sha1(f'{os.path.basename(music_filepath)}-{music_stat.st_mtime_ns}-{music_stat.st_size}'.encode()).hexdigest()
+    return os.path.join(os.path.dirname(music_filepath), TIME_STRETCH_CACHE_DIR_NAME, f'{music_hash}-{rate:.2f}.wav')
+
+def remove_stale_time_stretch_caches(cache_filepath):
+    cache_dir_filepath = os.path.dirname(cache_filepath)
+    if not os.path.exists(cache_dir_filepath):
+        return
+    music_hash = os.path.basename(cache_filepath).split('-')[0]
+    for cache_filename in os.listdir(cache_dir_filepath):
+        if not cache_filename.startswith(music_hash):
+            os.remove(os.path.join(cache_dir_filepath, cache_filename))
+
+TARGET_FPS_DEFAULT = 60
+VSYNC_DEFAULT = True
+# Only one of these exists depending on the platform and driver, and they are tried in order
+SWAP_INTERVAL_FUNCTIONS = [
+    ('OpenGL.GLX.MESA.swap_control', 'glXSwapIntervalMESA'),
+    ('OpenGL.GLX.SGI.swap_control', 'glXSwapIntervalSGI'),
+    ('OpenGL.WGL.EXT.swap_control', 'wglSwapIntervalEXT'),
+]
+
+# Frames are scheduled at fixed deadlines on [time.perf_counter()], the same timebase as [PlaybackClock], instead of
+# redrawing as fast as possible. When rendering falls behind, the missed frames are dropped rather than rendered late.
+class FrameScheduler:
+    def __init__(self, target_fps):
+        assert target_fps > 0
+        self._frame_period_seconds = 1 / target_fps
+        self._start_perf_time = None
+
+    def start(self):
+        perf_time = time.perf_counter()
+        self._start_perf_time = perf_time
+        self._next_frame_perf_time = perf_time
+        self._rendered_frame_count = 0
+        self._dropped_frame_count = 0
+
+    def seconds_until_next_frame(self):
+        return max(self._next_frame_perf_time - time.perf_counter(), 0)
+
+    def frame_rendered(self):
+        perf_time = time.perf_counter()
+        self._rendered_frame_count += 1
+        self._next_frame_perf_time += self._frame_period_seconds
+        if perf_time > self._next_frame_perf_time:
+            missed_frame_count = math.floor((perf_time - self._next_frame_perf_time) / self._frame_period_seconds)
+            self._dropped_frame_count += missed_frame_count
+            self._next_frame_perf_time += missed_frame_count * self._frame_period_seconds
+
+    def statistics(self):
+        if self._start_perf_time is None:
+            return None
+        elapsed_seconds = time.perf_counter() - self._start_perf_time
+        return {
+            'rendered_frame_count': self._rendered_frame_count,
+            'dropped_frame_count': self._dropped_frame_count,
+            'average_fps': self._rendered_frame_count / elapsed_seconds if elapsed_seconds > 0 else 0,
+        }
+
+def set_swap_interval(interval):
+    for module_name, function_name in SWAP_INTERVAL_FUNCTIONS:
+        try:
+            set_swap_interval_function = getattr(importlib.import_module(module_name), function_name)
+            set_swap_interval_function(interval)
+            return True
+        except (ImportError, AttributeError, NullFunctionError):
+            continue
+    return False
 
 ################
-# PARSING END
+# PLAYBACK END
 ################
 
 ################
 # DISPLAY START
 ################
 
-PRECOMPUTED_FPS = 300
-PRECOMPUTED_ADDITIONAL_SECONDS = 3
-
 POSITION_X = 0
 POSITION_Y = 0
 DISPLAY_WIDTH = 1200
@@ -389,20 +1047,278 @@ BLUE_RGB = (0.125, 0.125, 1.0)
 GREEN_RGB = (0.0, 0.8, 0.1)
 PURPLE_RGB = (0.5, 0.0, 0.75)
 ORANGE_RGB = (1.0, 0.9, 0.75)
+DDR_BEAT_QUANTIZATION_RGBS = [RED_RGB, BLUE_RGB, GREEN_RGB, PURPLE_RGB, WHITE_RGB] # Indexed in the same order as [DDR_BEAT_QUANTIZATIONS]
 
 HOLD_ALPHA = 0.2
 OUTLINE_ALPHA = 0.8
 
-class DisplayedBeat:
-    def __init__(self, rgb, direction, variant, position_y, position_y_hold_end):
-        self.rgb = rgb
-        self.direction = direction
-        self.variant = variant
-        self.position_y = position_y
-        self.position_y_hold_end = position_y_hold_end
+PROFILE_HUD_MARGIN = 10
+PROFILE_HUD_LINE_HEIGHT = 16
+
+CHART_LAYOUT_LOADER_POLL_INTERVAL_MILLISECONDS = 50
+PYGAME_IDLE_POLL_INTERVAL_MILLISECONDS = 10
+
+SEEK_MEASURE_COUNT = 1
+SEEK_MEASURE_COUNT_LARGE = 4
+SEEK_MEASURE_TOLERANCE = 1e-3 # Just after a seek, the chart is already slightly past the measure that was sought to
+
+# Convex polygons of an up arrow and of a mine, in a square of [ARROW_SIZE] whose bottom left corner is the origin
+ARROW_POLYGONS = [
+    [
+        (ARROW_DIAGONAL_WIDTH + ARROW_DIAGONAL_WIDTH/2, ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH + ARROW_DIAGONAL_WIDTH/2),
+        (ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH/2                       ),
+        (ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 + ARROW_DIAGONAL_WIDTH/2                       ),
+        (ARROW_SIZE/2                                 , ARROW_SIZE                                                  ),
+        (ARROW_SIZE/2 + ARROW_DIAGONAL_WIDTH          , ARROW_SIZE - ARROW_DIAGONAL_WIDTH                           ),
+    ],
+    [
+        (ARROW_SIZE - ARROW_DIAGONAL_WIDTH - ARROW_DIAGONAL_WIDTH/2, ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH + ARROW_DIAGONAL_WIDTH/2),
+        (ARROW_SIZE - ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH/2                       ),
+        (ARROW_SIZE - ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 + ARROW_DIAGONAL_WIDTH/2                       ),
+        (ARROW_SIZE/2                                              , ARROW_SIZE                                                  ),
+        (ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH                       , ARROW_SIZE - ARROW_DIAGONAL_WIDTH                           ),
+    ],
+    [
+        (ARROW_SIZE/2 - ARROW_STRAIGHT_WIDTH/2, ARROW_SIZE - ARROW_DIAGONAL_WIDTH),
+        (ARROW_SIZE/2 + ARROW_STRAIGHT_WIDTH/2, ARROW_SIZE - ARROW_DIAGONAL_WIDTH),
+        (ARROW_SIZE/2 + ARROW_STRAIGHT_WIDTH/2, ARROW_STRAIGHT_WIDTH/2           ),
+        (ARROW_SIZE/2                         , 0                                ),
+        (ARROW_SIZE/2 - ARROW_STRAIGHT_WIDTH/2, ARROW_STRAIGHT_WIDTH/2           ),
+    ],
+]
+MINE_POLYGONS = [
+    [
+        (MINE_MARGIN             , ARROW_SIZE - MINE_MARGIN),
+        (ARROW_SIZE - MINE_MARGIN, ARROW_SIZE - MINE_MARGIN),
+        (ARROW_SIZE - MINE_MARGIN, MINE_MARGIN             ),
+        (MINE_MARGIN             , MINE_MARGIN             ),
+    ],
+    [
+        (ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2                         ),
+        (ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2                         ),
+        (ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 - MINE_EXCLAMATION_WIDTH),
+        (ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 - MINE_EXCLAMATION_WIDTH),
+    ],
+    [
+        (ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2 - MINE_EXCLAMATION_WIDTH/6, ARROW_SIZE/2 + MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH),
+        (ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2 + MINE_EXCLAMATION_WIDTH/6, ARROW_SIZE/2 + MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH),
+        (ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2                           , ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH),
+        (ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2                           , ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH),
+    ],
+]
+MINE_POLYGON_RGBS = [ORANGE_RGB, RED_RGB, RED_RGB]
+
+# Polygons are split into triangle fans, as GL_POLYGON draws them, and outlined by one line per edge
+def get_polygon_triangle_vertices(polygon):
+    return [vertex for vertex_index in range(1, len(polygon) - 1) for vertex in (polygon[0], polygon[vertex_index], polygon[vertex_index + 1])]
+
+def get_polygon_line_vertices(polygon):
+    return [vertex for vertex_index in range(len(polygon)) for vertex in (polygon[vertex_index], polygon[(vertex_index + 1) % len(polygon)])]
+
+def with_alpha(rgbs, alpha):
+    return numpy.concatenate([rgbs, numpy.full((*rgbs.shape[:-1], 1), alpha, dtype=rgbs.dtype)], axis=-1)
+
+ARROW_TRIANGLE_VERTICES = numpy.array([vertex for polygon in ARROW_POLYGONS for vertex in get_polygon_triangle_vertices(polygon)])
+ARROW_LINE_VERTICES = numpy.array([vertex for polygon in ARROW_POLYGONS for vertex in get_polygon_line_vertices(polygon)])
+MINE_TRIANGLE_VERTICES = numpy.array([vertex for polygon in MINE_POLYGONS for vertex in get_polygon_triangle_vertices(polygon)])
+MINE_TRIANGLE_VERTEX_RGBAS = with_alpha(numpy.array([rgb for polygon, rgb in zip(MINE_POLYGONS, MINE_POLYGON_RGBS) for _ in get_polygon_triangle_vertices(polygon)], dtype=numpy.float32), 1.0)
+# Hold backgrounds span from the top of their arrow to their end, so only their triangles' layout is fixed
+HOLD_TRIANGLE_VERTEX_XS = numpy.array([0, ARROW_SIZE, ARROW_SIZE, 0, ARROW_SIZE, 0])
+HOLD_TRIANGLE_VERTEX_IS_END = numpy.array([False, False, True, False, True, True])
+
+LAYOUT_CACHE_DIR_NAME = 'layout_cache'
+LAYOUT_CACHE_MAGIC = b'DDRLAYOUT3'
+LAYOUT_CACHE_HEADER_LENGTH_SIZE = 8
+LAYOUT_CACHE_ALIGNMENT = 8
+
+# Everything needed to draw a chart at any point in time: its notes, their scroll positions (the number of measures
+# the chart has scrolled by when a note reaches the targets) and the song's timing, also in measures.
+# Positions are only scaled by the measure height when drawn, so the scroll speed can change at any time.
+# Layouts are cached on disk per simfile content and chart, as a header followed by one contiguous block per column,
+# so that a cached layout is memory-mapped instead of being recomputed. Only the beats and the timing are stored,
+# since scroll positions are the beats' measure times.
+class ChartLayout:
+    def __init__(self, beat_array, timing):
+        self.beat_array = beat_array
+        self.scroll_positions = beat_array.measure_times # float64, per beat
+        self.hold_end_scroll_positions = numpy.full(len(beat_array), numpy.nan) # float64, per beat, NaN if not a hold/roll start
+        is_hold_start = beat_array.hold_end_indices >= 0
+        self.hold_end_scroll_positions[is_hold_start] = self.scroll_positions[beat_array.hold_end_indices[is_hold_start]]
+        self.timing = timing
+
+    @classmethod
+    def compute(cls, song, beatmap):
+        return cls(beat_array=beatmap.ddr_beat_array(), timing=song.timing(measure_height=1))
+
+    # Time at which the last note reaches the target arrows
+    def end_time_seconds(self):
+        if len(self.scroll_positions) == 0:
+            return 0
+        return self.timing.time_until_pixel_distance(self.scroll_positions.max())
+
+    def save(self, filepath):
+        columns = {
+            'measure_times': self.beat_array.measure_times,
+            'directions': self.beat_array.directions,
+            'variant_codes': self.beat_array.variant_codes,
+            'color_indices': self.beat_array.color_indices,
+            'hold_end_indices': self.beat_array.hold_end_indices,
+            'section_start_times_seconds': self.timing.section_start_times_seconds,
+            'section_pixels_per_second': self.timing.section_pixels_per_second,
+            'section_accumulated_pixel_distances': self.timing.section_accumulated_pixel_distances,
+        }
+        column_headers = dict()
+        column_offset = 0
+        for column_name, column in columns.items():
+            column_headers[column_name] = {'dtype': column.dtype.str, 'length': len(column), 'offset': column_offset}
+            column_offset += align_to_layout_cache_alignment(column.nbytes)
+        header = json.dumps(column_headers).encode()
+        data_start = align_to_layout_cache_alignment(len(LAYOUT_CACHE_MAGIC) + LAYOUT_CACHE_HEADER_LENGTH_SIZE + len(header))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temporary_filepath = f'{filepath}.tmp'
+        with open(temporary_filepath, 'wb') as f:
+            f.write(LAYOUT_CACHE_MAGIC)
+            f.write(len(header).to_bytes(LAYOUT_CACHE_HEADER_LENGTH_SIZE, 'little'))
+            f.write(header)
+            for column_name, column in columns.items():
+                f.seek(data_start + column_headers[column_name]['offset'])
+                f.write(numpy.ascontiguousarray(column).tobytes())
+            f.truncate(data_start + column_offset)
+        os.replace(temporary_filepath, filepath) # Never leave a partially written layout behind
+
+    @classmethod
+    def load(cls, filepath):
+        buffer = numpy.memmap(filepath, dtype=numpy.uint8, mode='r')
+        if bytes(buffer[:len(LAYOUT_CACHE_MAGIC)]) != LAYOUT_CACHE_MAGIC:
+            raise ValueError(f'{filepath} is not a chart layout')
+        header_start = len(LAYOUT_CACHE_MAGIC) + LAYOUT_CACHE_HEADER_LENGTH_SIZE
+        header_length = int.from_bytes(bytes(buffer[len(LAYOUT_CACHE_MAGIC):header_start]), 'little')
+        column_headers = json.loads(bytes(buffer[header_start:header_start+header_length]))
+        data_start = align_to_layout_cache_alignment(header_start + header_length)
+        columns = {column_name: numpy.frombuffer(buffer, dtype=numpy.dtype(column_header['dtype']), count=column_header['length'], offset=data_start+column_header['offset']) for column_name, column_header in column_headers.items()}
+        return cls(
+            beat_array=BeatArray(
+                measure_times=columns['measure_times'],
+                directions=columns['directions'],
+                variant_codes=columns['variant_codes'],
+                color_indices=columns['color_indices'],
+                hold_end_indices=columns['hold_end_indices'],
+            ),
+            timing=SongTiming(
+                section_start_times_seconds=columns['section_start_times_seconds'],
+                section_pixels_per_second=columns['section_pixels_per_second'],
+                section_accumulated_pixel_distances=columns['section_accumulated_pixel_distances'],
+            ),
+        )
 
-class DDRWindow:
-    def __init__(self, song, beatmap, measure_height_selected, song_music_filepath, song_custom_offset_filepath, precomputed_fps=PRECOMPUTED_FPS, position_x=POSITION_X, position_y=POSITION_Y, display_width=DISPLAY_WIDTH, display_height=DISPLAY_HEIGHT):
+def align_to_layout_cache_alignment(size):
+    return -(-size // LAYOUT_CACHE_ALIGNMENT) * LAYOUT_CACHE_ALIGNMENT
+
+def get_chart_layout(song, beatmap):
+    cache_filepath = get_chart_layout_cache_filepath(beatmap)
+    if cache_filepath and os.path.exists(cache_filepath):
+        try:
+            with profiler.timer('chart_layout_load'):
+                return ChartLayout.load(cache_filepath)
+        except (ValueError, KeyError, TypeError):
+            pass # Unreadable layouts are recomputed and overwritten
+    with profiler.timer('chart_layout_compute'):
+        chart_layout = ChartLayout.compute(song, beatmap)
+    if cache_filepath:
+        remove_stale_chart_layouts(cache_filepath)
+        chart_layout.save(cache_filepath)
+    return chart_layout
+
+# Cached layouts are named after a hash of the whole simfile, so editing the simfile invalidates all of its layouts
+def get_chart_layout_cache_filepath(beatmap):
+    if not beatmap.simfile_filepath():
+        return None
+    with open(beatmap.simfile_filepath(), 'rb') as f:
+        simfile_hash = hashlib.sha1(f.read()).hexdigest()
+    notes_start, _ = beatmap.notes_byte_range()
+    return os.path.join(os.path.dirname(beatmap.simfile_filepath()), LAYOUT_CACHE_DIR_NAME, f'{simfile_hash}-{notes_start}.layout')
+
+def remove_stale_chart_layouts(cache_filepath):
+    cache_dir_filepath = os.path.dirname(cache_filepath)
+    if not os.path.exists(cache_dir_filepath):
+        return
+    simfile_hash = os.path.basename(cache_filepath).split('-')[0]
+    for cache_filename in os.listdir(cache_dir_filepath):
+        if not cache_filename.startswith(simfile_hash):
+            os.remove(os.path.join(cache_dir_filepath, cache_filename))
+
+# Loads (or computes) a chart layout on a background thread, so that the window can open right away
+class ChartLayoutLoader:
+    def __init__(self, song, beatmap):
+        self._song = song
+        self._beatmap = beatmap
+        self._chart_layout = None
+        self._error = None
+        self._load_seconds = None
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def chart_layout(self):
+        return self._chart_layout
+
+    def is_ready(self):
+        return self._chart_layout is not None
+
+    def error(self):
+        return self._error
+
+    def load_seconds(self):
+        return self._load_seconds
+
+    def _load(self):
+        start_load_time = time.time()
+        try:
+            chart_layout = get_chart_layout(self._song, self._beatmap)
+        except Exception as e: # Reported by the window polling the loader, e.g. notes that cannot be parsed
+            self._error = e
+            return
+        self._load_seconds = time.time() - start_load_time
+        self._chart_layout = chart_layout
+
+# Beats are sorted by their scroll position, so the beats within a window of scroll positions are found by bisection.
+# Hold notes that start before the window can still be on screen, but since holds in the same lane never overlap,
+# at most one such hold per lane needs to be checked.
+class VisibleBeatIndex:
+    def __init__(self, chart_layout):
+        self._chart_layout = chart_layout
+        beat_array = chart_layout.beat_array
+        self._lane_hold_start_indices = [numpy.flatnonzero((beat_array.directions == direction.value) & (beat_array.hold_end_indices >= 0)) for direction in BeatDirection]
+        self._lane_hold_start_scroll_positions = [chart_layout.scroll_positions[hold_start_indices] for hold_start_indices in self._lane_hold_start_indices]
+
+    def visible_beat_indices(self, scroll_position_min, scroll_position_max):
+        visible_beat_indices = []
+        for hold_start_indices, hold_start_scroll_positions in zip(self._lane_hold_start_indices, self._lane_hold_start_scroll_positions):
+            lane_hold_index = numpy.searchsorted(hold_start_scroll_positions, scroll_position_min, side='left') - 1
+            if lane_hold_index < 0:
+                continue
+            beat_index = hold_start_indices[lane_hold_index]
+            if self._chart_layout.hold_end_scroll_positions[beat_index] >= scroll_position_min:
+                visible_beat_indices.append(beat_index)
+        visible_beat_indices.sort()
+        first_beat_index = numpy.searchsorted(self._chart_layout.scroll_positions, scroll_position_min, side='left')
+        last_beat_index = numpy.searchsorted(self._chart_layout.scroll_positions, scroll_position_max, side='right')
+        is_displayed = self._chart_layout.beat_array.variant_codes[first_beat_index:last_beat_index] != ord(DDR_BEAT_VARIANT_HOLD_END)
+        return numpy.concatenate([numpy.array(visible_beat_indices, dtype=numpy.intp), first_beat_index + numpy.flatnonzero(is_displayed)])
+
+# Vertices are (x, y relative to the note, scroll position of the note), in the order of the notes they were built
+# from; the vertices of the [i]th note start at index [vertex_starts[i]]
+class NoteGeometry:
+    def __init__(self, triangle_vertices, triangle_colors, triangle_vertex_starts, line_vertices, line_colors, line_vertex_starts):
+        self.triangle_vertices = triangle_vertices
+        self.triangle_colors = triangle_colors
+        self.triangle_vertex_starts = triangle_vertex_starts
+        self.line_vertices = line_vertices
+        self.line_colors = line_colors
+        self.line_vertex_starts = line_vertex_starts
+
+# Draws a chart into the current GL context, so it can be used without a window (GL is only needed by [render]).
+# The notes on screen are written into vertex arrays every frame.
+class ChartRenderer:
+    def __init__(self, chart_layout, measure_height=MEASURE_HEIGHT_OPTIONS[MEASURE_HEIGHT_DEFAULT_INDEX], position_x=POSITION_X, position_y=POSITION_Y, display_width=DISPLAY_WIDTH, display_height=DISPLAY_HEIGHT):
         self._position_x = position_x
         self._position_y = position_y
         self._display_width = display_width
@@ -412,116 +1328,569 @@ class DDRWindow:
         self._arrow_down_position_x = display_width/2 - ARROW_HORIZONTAL_MARGIN/2 - ARROW_SIZE
         self._arrow_up_position_x = display_width/2 + ARROW_HORIZONTAL_MARGIN/2
         self._arrow_right_position_x = display_width/2 + ARROW_HORIZONTAL_MARGIN/2 + ARROW_SIZE + ARROW_HORIZONTAL_MARGIN
+        self._chart_layout = chart_layout
+        self._visible_beat_index = VisibleBeatIndex(chart_layout)
+        self._measure_height = measure_height
+        self._lane_position_xs = numpy.array([self._position_x_from_direction(direction) for direction in BeatDirection])
+        self._lane_arrow_triangle_vertices = self._lane_arrow_vertices(ARROW_TRIANGLE_VERTICES)
+        self._lane_arrow_line_vertices = self._lane_arrow_vertices(ARROW_LINE_VERTICES)
+        self._lane_mine_triangle_vertices = self._lane_mine_vertices(MINE_TRIANGLE_VERTICES)
+        self._target_arrow_line_vertices = (self._lane_arrow_line_vertices + (0, self._arrow_target_position_y)).reshape(-1, 2)
+        self._target_arrow_line_colors = numpy.tile(with_alpha(numpy.array(WHITE_RGB, dtype=numpy.float32), OUTLINE_ALPHA), (len(self._target_arrow_line_vertices), 1))
+        self._quantization_rgbs = numpy.array(DDR_BEAT_QUANTIZATION_RGBS, dtype=numpy.float32)
+
+    # Takes effect from the next frame, since nothing depends on the measure height until notes are drawn
+    def set_measure_height(self, measure_height):
+        self._measure_height = measure_height
+
+    # Returns the number of notes drawn
+    def render(self, current_time):
+        self._display_reset()
+        self._target_arrows()
+        return self._moving_arrows(current_time)
 
-        glutInit()
-        glutInitDisplayMode(GLUT_RGBA)
-        glutInitWindowPosition(position_x, position_y)
-        glutInitWindowSize(display_width, display_height)
-        self._window = glutCreateWindow("D/DR")
+    # Positions are computed at the actual playback time every frame, so the playback time is never rounded.
+    # Returns the visible beat indices, along with the current scroll position.
+    def _visible_beats_at_time(self, current_time):
+        current_scroll_position = self._chart_layout.timing.pixel_distance_until_time(current_time)
+        # Inverse of [_scroll_position_to_position_y] at the bottom and top edges of the display
+        scroll_position_min = current_scroll_position + (self._arrow_target_position_y - self._display_height) / self._measure_height
+        scroll_position_max = current_scroll_position + (self._arrow_target_position_y + ARROW_SIZE) / self._measure_height
+        with profiler.timer('visible_beats'):
+            return self._visible_beat_index.visible_beat_indices(scroll_position_min, scroll_position_max), current_scroll_position
+
+    def _scroll_position_to_position_y(self, scroll_position, current_scroll_position):
+        return self._arrow_target_position_y - (scroll_position - current_scroll_position) * self._measure_height
+
+    def _display_reset(self):
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         glEnable(GL_BLEND)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glLoadIdentity()
+
+        glViewport(
+            self._position_x, # x
+            self._position_y, # y
+            self._display_width, # width
+            self._display_height, # height
+        )
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+
+        glOrtho(
+            self._position_x, # left
+            self._position_x + self._display_width, # right
+            self._position_y, # bottom
+            self._position_y + self._display_height, # top
+            0.0, # near_val
+            1.0, # far_val
+        )
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+
+    def _target_arrows(self):
+        self._draw_vertices(GL_LINES, self._target_arrow_line_vertices, self._target_arrow_line_colors)
+
+    def _moving_arrows(self, current_time):
+        beat_indices, current_scroll_position = self._visible_beats_at_time(current_time)
+        note_geometry = self._note_geometry(beat_indices)
+        self._draw_vertices(GL_TRIANGLES, self._scrolled_vertices(note_geometry.triangle_vertices, current_scroll_position), note_geometry.triangle_colors)
+        self._draw_vertices(GL_LINES, self._scrolled_vertices(note_geometry.line_vertices, current_scroll_position), note_geometry.line_colors)
+        return len(beat_indices)
+
+    # Every note is written into one array of triangles, in the same order as the notes (with the background of a
+    # hold before its arrow), so that notes overlap exactly as if they were drawn one by one. Hold end outlines are
+    # lines, so they are drawn after all of them. Hold ends are drawn along with their hold start, so they have no
+    # vertices of their own.
+    def _note_geometry(self, beat_indices):
+        beat_array = self._chart_layout.beat_array
+        directions = beat_array.directions[beat_indices]
+        rgbs = self._quantization_rgbs[beat_array.color_indices[beat_indices]]
+        scroll_positions = self._chart_layout.scroll_positions[beat_indices]
+        hold_end_scroll_positions = self._chart_layout.hold_end_scroll_positions[beat_indices]
+        variant_codes = beat_array.variant_codes[beat_indices]
+        is_mine = variant_codes == ord(DDR_BEAT_VARIANT_MINE)
+        is_hold_end = variant_codes == ord(DDR_BEAT_VARIANT_HOLD_END)
+        is_arrow = ~is_mine & ~is_hold_end
+        is_hold = ~numpy.isnan(hold_end_scroll_positions)
+
+        triangle_vertex_counts = numpy.select([is_mine, is_hold_end], [len(MINE_TRIANGLE_VERTICES), 0], len(ARROW_TRIANGLE_VERTICES) + is_hold * len(HOLD_TRIANGLE_VERTEX_IS_END))
+        triangle_vertex_starts = numpy.concatenate([[0], numpy.cumsum(triangle_vertex_counts)])
+        triangle_vertices = numpy.empty((triangle_vertex_starts[-1], 3))
+        triangle_colors = numpy.empty((len(triangle_vertices), 4), dtype=numpy.float32)
+
+        hold_vertex_indices = triangle_vertex_starts[:-1][is_hold, numpy.newaxis] + numpy.arange(len(HOLD_TRIANGLE_VERTEX_IS_END))
+        triangle_vertices[hold_vertex_indices, 0] = self._lane_position_xs[directions[is_hold], numpy.newaxis] + HOLD_TRIANGLE_VERTEX_XS
+        triangle_vertices[hold_vertex_indices, 1] = numpy.where(HOLD_TRIANGLE_VERTEX_IS_END, 0, ARROW_SIZE)
+        triangle_vertices[hold_vertex_indices, 2] = numpy.where(HOLD_TRIANGLE_VERTEX_IS_END, hold_end_scroll_positions[is_hold, numpy.newaxis], scroll_positions[is_hold, numpy.newaxis])
+        triangle_colors[hold_vertex_indices] = with_alpha(rgbs[is_hold], HOLD_ALPHA)[:, numpy.newaxis]
+
+        arrow_vertex_indices = (triangle_vertex_starts[:-1] + is_hold * len(HOLD_TRIANGLE_VERTEX_IS_END))[is_arrow, numpy.newaxis] + numpy.arange(len(ARROW_TRIANGLE_VERTICES))
+        triangle_vertices[arrow_vertex_indices, :2] = self._lane_arrow_triangle_vertices[directions[is_arrow]]
+        triangle_vertices[arrow_vertex_indices, 2] = scroll_positions[is_arrow, numpy.newaxis]
+        triangle_colors[arrow_vertex_indices] = with_alpha(rgbs[is_arrow], 1.0)[:, numpy.newaxis]
+
+        mine_vertex_indices = triangle_vertex_starts[:-1][is_mine, numpy.newaxis] + numpy.arange(len(MINE_TRIANGLE_VERTICES))
+        triangle_vertices[mine_vertex_indices, :2] = self._lane_mine_triangle_vertices[directions[is_mine]]
+        triangle_vertices[mine_vertex_indices, 2] = scroll_positions[is_mine, numpy.newaxis]
+        triangle_colors[mine_vertex_indices] = MINE_TRIANGLE_VERTEX_RGBAS
+
+        line_vertices = numpy.empty((numpy.count_nonzero(is_hold), len(ARROW_LINE_VERTICES), 3))
+        line_vertices[:, :, :2] = self._lane_arrow_line_vertices[directions[is_hold]]
+        line_vertices[:, :, 2] = hold_end_scroll_positions[is_hold, numpy.newaxis]
+        line_colors = numpy.broadcast_to(with_alpha(rgbs[is_hold], OUTLINE_ALPHA)[:, numpy.newaxis], (*line_vertices.shape[:2], 4))
+        line_vertex_starts = numpy.concatenate([[0], numpy.cumsum(is_hold * len(ARROW_LINE_VERTICES))])
+
+        return NoteGeometry(
+            triangle_vertices=triangle_vertices,
+            triangle_colors=triangle_colors,
+            triangle_vertex_starts=triangle_vertex_starts,
+            line_vertices=line_vertices.reshape(-1, 3),
+            line_colors=line_colors.reshape(-1, 4),
+            line_vertex_starts=line_vertex_starts,
+        )
+
+    def _scrolled_vertices(self, note_vertices, current_scroll_position):
+        vertices = note_vertices[:, :2].copy()
+        vertices[:, 1] += self._scroll_position_to_position_y(note_vertices[:, 2], current_scroll_position)
+        return vertices
+
+    def _draw_vertices(self, mode, vertices, colors):
+        if len(vertices) == 0:
+            return
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, numpy.ascontiguousarray(vertices, dtype=numpy.float32))
+        glColorPointer(4, GL_FLOAT, 0, numpy.ascontiguousarray(colors, dtype=numpy.float32))
+        glDrawArrays(mode, 0, len(vertices))
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    # Arrow vertices of every lane, relative to the bottom of the arrow, as [glRotatef] would rotate them around
+    # the center of the arrow
+    def _lane_arrow_vertices(self, arrow_vertices):
+        lane_arrow_vertices = []
+        for direction in BeatDirection:
+            rotation_angle_radians = math.radians(self._rotation_angle_degrees_from_direction(direction))
+            rotation = numpy.array([[math.cos(rotation_angle_radians), -math.sin(rotation_angle_radians)], [math.sin(rotation_angle_radians), math.cos(rotation_angle_radians)]])
+            lane_arrow_vertices.append((arrow_vertices - ARROW_SIZE/2) @ rotation.T + ARROW_SIZE/2 + (self._position_x_from_direction(direction), 0))
+        return numpy.array(lane_arrow_vertices)
+
+    def _lane_mine_vertices(self, mine_vertices):
+        return numpy.array([mine_vertices + (self._position_x_from_direction(direction), 0) for direction in BeatDirection])
+
+    def _position_x_from_direction(self, direction):
+        match direction:
+            case BeatDirection.LEFT:
+                return self._arrow_left_position_x
+            case BeatDirection.DOWN:
+                return self._arrow_down_position_x
+            case BeatDirection.UP:
+                return self._arrow_up_position_x
+            case BeatDirection.RIGHT:
+                return self._arrow_right_position_x
+
+    def _rotation_angle_degrees_from_direction(self, direction):
+        match direction:
+            case BeatDirection.LEFT:
+                return 90
+            case BeatDirection.DOWN:
+                return 180
+            case BeatDirection.UP:
+                return 0
+            case BeatDirection.RIGHT:
+                return 270
+
+# GLSL 1.20, so that it runs on any OpenGL 2.1 driver, including Mesa's software renderers
+STATIC_CHART_VERTEX_SHADER = '''
+#version 120
+uniform float current_scroll_position;
+uniform float measure_height;
+uniform float arrow_target_position_y;
+attribute vec2 note_position; // Relative to the bottom of the note
+attribute float scroll_position;
+attribute vec4 color;
+varying vec4 vertex_color;
+void main() {
+    vec2 position = vec2(note_position.x, arrow_target_position_y - (scroll_position - current_scroll_position) * measure_height + note_position.y);
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(position, 0.0, 1.0);
+    vertex_color = color;
+}
+'''
+STATIC_CHART_FRAGMENT_SHADER = '''
+#version 120
+varying vec4 vertex_color;
+void main() {
+    gl_FragColor = vertex_color;
+}
+'''
+STATIC_CHART_ATTRIBUTE_LOCATIONS = {'note_position': 0, 'scroll_position': 1, 'color': 2}
+STATIC_CHART_VERTEX_SIZE = 7 * ctypes.sizeof(ctypes.c_float) # Note position, scroll position and color
+
+# Uploads the geometry of every note to the GPU once, so that each frame only sets the current scroll position.
+# Scroll positions are in measures, so BPM changes and stops only affect the current scroll position, which the
+# song timing gives for the current time. Only the vertices between the first and last visible notes are drawn.
+class StaticChartRenderer(ChartRenderer):
+    def __init__(self, chart_layout, **kwargs):
+        super().__init__(chart_layout, **kwargs)
+        self._program = create_shader_program(STATIC_CHART_VERTEX_SHADER, STATIC_CHART_FRAGMENT_SHADER, STATIC_CHART_ATTRIBUTE_LOCATIONS)
+        self._uniform_locations = {uniform_name: glGetUniformLocation(self._program, uniform_name) for uniform_name in ['current_scroll_position', 'measure_height', 'arrow_target_position_y']}
+        note_geometry = self._note_geometry(numpy.arange(len(chart_layout.beat_array)))
+        self._triangle_buffer = create_static_vertex_buffer(note_geometry.triangle_vertices, note_geometry.triangle_colors)
+        self._triangle_vertex_starts = note_geometry.triangle_vertex_starts
+        self._line_buffer = create_static_vertex_buffer(note_geometry.line_vertices, note_geometry.line_colors)
+        self._line_vertex_starts = note_geometry.line_vertex_starts
+
+    def _moving_arrows(self, current_time):
+        beat_indices, current_scroll_position = self._visible_beats_at_time(current_time)
+        if len(beat_indices) == 0:
+            return 0
+        first_beat_index = beat_indices.min()
+        last_beat_index = beat_indices.max()
+        glUseProgram(self._program)
+        glUniform1f(self._uniform_locations['current_scroll_position'], current_scroll_position)
+        glUniform1f(self._uniform_locations['measure_height'], self._measure_height)
+        glUniform1f(self._uniform_locations['arrow_target_position_y'], self._arrow_target_position_y)
+        self._draw_buffer(GL_TRIANGLES, self._triangle_buffer, self._triangle_vertex_starts[first_beat_index], self._triangle_vertex_starts[last_beat_index + 1])
+        self._draw_buffer(GL_LINES, self._line_buffer, self._line_vertex_starts[first_beat_index], self._line_vertex_starts[last_beat_index + 1])
+        glUseProgram(0)
+        return len(beat_indices)
+
+    def _draw_buffer(self, mode, vertex_buffer, vertex_start, vertex_end):
+        if vertex_end == vertex_start:
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
+        for attribute_location in STATIC_CHART_ATTRIBUTE_LOCATIONS.values():
+            glEnableVertexAttribArray(attribute_location)
+        glVertexAttribPointer(STATIC_CHART_ATTRIBUTE_LOCATIONS['note_position'], 2, GL_FLOAT, GL_FALSE, STATIC_CHART_VERTEX_SIZE, ctypes.c_void_p(0))
+        glVertexAttribPointer(STATIC_CHART_ATTRIBUTE_LOCATIONS['scroll_position'], 1, GL_FLOAT, GL_FALSE, STATIC_CHART_VERTEX_SIZE, ctypes.c_void_p(2 * ctypes.sizeof(ctypes.c_float)))
+        glVertexAttribPointer(STATIC_CHART_ATTRIBUTE_LOCATIONS['color'], 4, GL_FLOAT, GL_FALSE, STATIC_CHART_VERTEX_SIZE, ctypes.c_void_p(3 * ctypes.sizeof(ctypes.c_float)))
+        glDrawArrays(mode, int(vertex_start), int(vertex_end - vertex_start))
+        for attribute_location in STATIC_CHART_ATTRIBUTE_LOCATIONS.values():
+            glDisableVertexAttribArray(attribute_location)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+# Raises a RuntimeError with the driver's log if a shader does not compile or link
+def create_shader_program(vertex_shader_source, fragment_shader_source, attribute_locations):
+    program = glCreateProgram()
+    for shader_type, shader_source in [(GL_VERTEX_SHADER, vertex_shader_source), (GL_FRAGMENT_SHADER, fragment_shader_source)]:
+        shader = glCreateShader(shader_type)
+        glShaderSource(shader, shader_source)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            raise RuntimeError(f'Could not compile shader: {glGetShaderInfoLog(shader).decode()}')
+        glAttachShader(program, shader)
+        glDeleteShader(shader) # Only deleted along with the program
+    for attribute_name, attribute_location in attribute_locations.items():
+        glBindAttribLocation(program, attribute_location, attribute_name)
+    glLinkProgram(program)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise RuntimeError(f'Could not link shader program: {glGetProgramInfoLog(program).decode()}')
+    return program
+
+# Scroll positions are stored as float32 like everything else on the GPU, which is still precise to a fraction of a
+# pixel for charts of up to a few hundred measures
+def create_static_vertex_buffer(note_vertices, colors):
+    vertex_buffer = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
+    glBufferData(GL_ARRAY_BUFFER, numpy.ascontiguousarray(numpy.concatenate([note_vertices, colors], axis=1), dtype=numpy.float32), GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+    return vertex_buffer
+
+SPRITE_ATLAS_COLUMN_COUNT = 10
+
+# Draws into a pygame surface, without OpenGL. Every note sprite is rasterized once into a single atlas surface, so
+# that each frame is only one batch of blits from it, in the same order as the notes are drawn by [ChartRenderer].
+# Holds are clipped to the surface, which is the whole display (so [position_x] and [position_y] are not used).
+class SpriteChartRenderer(ChartRenderer):
+    def __init__(self, chart_layout, surface, **kwargs):
+        import_pygame()
+        super().__init__(chart_layout, **kwargs)
+        self._surface = surface
+        arrow_rgbs = DDR_BEAT_QUANTIZATION_RGBS
+        sprite_count = 2 * len(BeatDirection) * len(arrow_rgbs) + len(BeatDirection) + 1 # Arrows, outlines, target outlines and the mine
+        sprite_row_count = math.ceil(sprite_count / SPRITE_ATLAS_COLUMN_COUNT)
+        self._atlas = pygame.Surface(((SPRITE_ATLAS_COLUMN_COUNT + len(arrow_rgbs)) * ARROW_SIZE, max(sprite_row_count * ARROW_SIZE, self._display_height)), pygame.SRCALPHA)
+        self._atlas.fill((0, 0, 0, 0))
+        sprite_areas = (pygame.Rect(sprite_index % SPRITE_ATLAS_COLUMN_COUNT * ARROW_SIZE, sprite_index // SPRITE_ATLAS_COLUMN_COUNT * ARROW_SIZE, ARROW_SIZE, ARROW_SIZE) for sprite_index in range(sprite_count))
+        lane_arrow_polygons = [self._lane_arrow_polygons(polygon) for polygon in ARROW_POLYGONS]
+        # Indexed by direction, then by color index
+        self._arrow_areas = [[self._draw_sprite(next(sprite_areas), [polygons[direction.value] for polygons in lane_arrow_polygons], [(rgb, 1.0)] * len(ARROW_POLYGONS)) for rgb in arrow_rgbs] for direction in BeatDirection]
+        self._outline_areas = [[self._draw_sprite(next(sprite_areas), [polygons[direction.value] for polygons in lane_arrow_polygons], [(rgb, OUTLINE_ALPHA)] * len(ARROW_POLYGONS), outline=True) for rgb in arrow_rgbs] for direction in BeatDirection]
+        target_outline_areas = [self._draw_sprite(next(sprite_areas), [polygons[direction.value] for polygons in lane_arrow_polygons], [(WHITE_RGB, OUTLINE_ALPHA)] * len(ARROW_POLYGONS), outline=True) for direction in BeatDirection]
+        self._mine_area = self._draw_sprite(next(sprite_areas), MINE_POLYGONS, [(rgb, 1.0) for rgb in MINE_POLYGON_RGBS])
+        # Indexed by color index, as tall as the display so that any visible part of a hold is a sub-area of it
+        self._hold_areas = []
+        for color_index, rgb in enumerate(arrow_rgbs):
+            hold_area = pygame.Rect((SPRITE_ATLAS_COLUMN_COUNT + color_index) * ARROW_SIZE, 0, ARROW_SIZE, self._display_height)
+            self._atlas.fill(get_surface_rgba(rgb, HOLD_ALPHA), hold_area)
+            self._hold_areas.append(hold_area)
+        if pygame.display.get_surface(): # Blits are faster from the display's pixel format
+            self._atlas = self._atlas.convert_alpha()
+        self._lane_sprite_xs = [round(position_x) for position_x in self._lane_position_xs]
+        self._target_arrow_blits = [(self._atlas, (lane_sprite_x, int(self._position_y_to_sprite_y(self._arrow_target_position_y))), target_outline_area) for lane_sprite_x, target_outline_area in zip(self._lane_sprite_xs, target_outline_areas)]
+
+    # Returns the number of notes drawn
+    def render(self, current_time):
+        beat_indices, current_scroll_position = self._visible_beats_at_time(current_time)
+        beat_array = self._chart_layout.beat_array
+        sprite_ys = self._position_y_to_sprite_y(self._scroll_position_to_position_y(self._chart_layout.scroll_positions[beat_indices], current_scroll_position))
+        hold_end_sprite_ys = self._position_y_to_sprite_y(self._scroll_position_to_position_y(numpy.nan_to_num(self._chart_layout.hold_end_scroll_positions[beat_indices], nan=-1), current_scroll_position))
+        is_hold = ~numpy.isnan(self._chart_layout.hold_end_scroll_positions[beat_indices])
+        is_mine = beat_array.variant_codes[beat_indices] == ord(DDR_BEAT_VARIANT_MINE)
+
+        blit_sequence = list(self._target_arrow_blits)
+        hold_end_blit_sequence = [] # Hold end outlines are drawn over every note, like the lines of [ChartRenderer]
+        for direction, color_index, sprite_y, hold_end_sprite_y, is_note_hold, is_note_mine in zip(beat_array.directions[beat_indices].tolist(), beat_array.color_indices[beat_indices].tolist(), sprite_ys.tolist(), hold_end_sprite_ys.tolist(), is_hold.tolist(), is_mine.tolist()):
+            sprite_x = self._lane_sprite_xs[direction]
+            if is_note_mine:
+                blit_sequence.append((self._atlas, (sprite_x, sprite_y), self._mine_area))
+                continue
+            if is_note_hold:
+                hold_top = max(sprite_y, 0)
+                hold_bottom = min(hold_end_sprite_y + ARROW_SIZE, self._display_height)
+                if hold_bottom > hold_top:
+                    hold_area = self._hold_areas[color_index]
+                    blit_sequence.append((self._atlas, (sprite_x, hold_top), (hold_area.x, 0, ARROW_SIZE, hold_bottom - hold_top)))
+                hold_end_blit_sequence.append((self._atlas, (sprite_x, hold_end_sprite_y), self._outline_areas[direction][color_index]))
+            blit_sequence.append((self._atlas, (sprite_x, sprite_y), self._arrow_areas[direction][color_index]))
+
+        with profiler.timer('blits'):
+            self._surface.fill((0, 0, 0))
+            self._surface.blits(blit_sequence + hold_end_blit_sequence, doreturn=False)
+        return len(beat_indices)
+
+    # Surface y axes point down, from the top of the display to the top of the sprite
+    def _position_y_to_sprite_y(self, position_y):
+        return numpy.rint(self._display_height - ARROW_SIZE - numpy.asarray(position_y)).astype(int)
+
+    # Polygon of every lane, relative to the bottom left corner of the arrow
+    def _lane_arrow_polygons(self, polygon):
+        return self._lane_arrow_vertices(numpy.array(polygon)) - numpy.stack([self._lane_position_xs, numpy.zeros(len(self._lane_position_xs))], axis=1)[:, numpy.newaxis]
+
+    # Returns the atlas area that was drawn in
+    def _draw_sprite(self, sprite_area, polygons, rgb_alphas, outline=False):
+        for polygon, (rgb, alpha) in zip(polygons, rgb_alphas):
+            points = [(sprite_area.x + x, sprite_area.y + ARROW_SIZE - y) for x, y in polygon]
+            pygame.draw.polygon(self._atlas, get_surface_rgba(rgb, alpha), points, width=1 if outline else 0)
+        return sprite_area
+
+def get_surface_rgba(rgb, alpha):
+    return tuple(round(component * 255) for component in (*rgb, alpha))
+
+CHART_RENDERER_CLASSES = {
+    'vertex_arrays': ChartRenderer,
+    'static_buffer': StaticChartRenderer,
+}
+CHART_RENDERER_DEFAULT = 'vertex_arrays'
+
+# Plays a chart along with its music. Everything that depends on how the window is shown is left to subclasses, see
+# [GlutDDRWindow] and [PygameDDRWindow].
+class DDRWindow(abc.ABC):
+    def __init__(self, song, beatmap, measure_height_selected, song_music_filepath, song_custom_offset_filepath, position_x=POSITION_X, position_y=POSITION_Y, display_width=DISPLAY_WIDTH, display_height=DISPLAY_HEIGHT, target_fps=TARGET_FPS_DEFAULT, start_when_loaded=False, quit_after_first_frame=False):
+        self._position_x = position_x
+        self._position_y = position_y
+        self._display_width = display_width
+        self._display_height = display_height
+        self._start_when_loaded = start_when_loaded
+        self._quit_after_first_frame = quit_after_first_frame # For measuring the startup time
+        self._first_frame_drawn = False
 
+        import_pygame()
         pygame.mixer.init()
         pygame.mixer.music.load(song_music_filepath)
-
-        print('⏳️ Precomputing...')
-        start_precomputing_time = time.time()
-        self._precomputed_displays = self._precompute_displays(song, beatmap, measure_height_selected, precomputed_fps)
+        self._song_music_filepath = song_music_filepath
+        self._loaded_music_filepath = song_music_filepath
+        self._playback_rate_index = PLAYBACK_RATE_DEFAULT_INDEX
+        self._time_stretched_musics = dict() # By playback rate
+
+        self._measure_height_index = MEASURE_HEIGHT_OPTIONS.index(measure_height_selected)
+        self._chart_layout_loader = ChartLayoutLoader(song, beatmap)
+        self._chart_layout = None
+        self._chart_renderer = None # Created once the chart layout is loaded
         self._beatmap_music_offset = beatmap.music_offset()
         self._song_music_offset = song.music_offset()
         self._custom_offset_filepath = song_custom_offset_filepath
         self._custom_offset = self._get_custom_offset_from_file()
-        end_precomputing_time = time.time()
-        print(f'✅ Precomputing complete! ({round(end_precomputing_time-start_precomputing_time, 1)}s)')
 
+        self._playback_clock = PlaybackClock(lambda: pygame.mixer.music.get_pos() / MILLISECONDS_IN_SECONDS)
+        self._frame_scheduler = FrameScheduler(target_fps)
+        self._is_profile_hud_shown = False
         self._started = False
+        self._loop_start_measure = None
+        self._loop_end_measure = None
 
-    # This can theoretically be optimized by using the fact that [beat_list] is sorted by [measure_time],
-    # but doing so feels like over-engineering since this is a precomputing step
-    def _precompute_displays(self, song, beatmap, measure_height_selected, precomputed_fps):
-        sections = song.sections(measure_height_selected)
-        beats_per_measure = song.beats_per_measure()
-
-        def time_seconds_to_section(time_seconds):
-            for section_index, section in enumerate(sections):
-                if section.time_seconds > time_seconds:
-                    return sections[section_index-1]
-            return sections[-1]
-
-        def pixel_distance_until_time(time_seconds):
-            section = time_seconds_to_section(time_seconds)
-            return section.accumulated_pixel_distance_start + section.pixel_distance_until_time(end_time_seconds=time_seconds, beats_per_measure=beats_per_measure, measure_height=measure_height_selected)
-
-        def measure_time_to_position_y_at_frame(measure_time, frame):
-            initial_position_y = self._arrow_target_position_y - measure_time * measure_height_selected
-            return initial_position_y + pixel_distance_until_time(time_seconds=frame/precomputed_fps)
-
-        beat_list = beatmap.ddr_beat_list()
-
-        def get_last_frame_to_precompute():
-            last_beat_measure_time = max([beat.measure_time for beat in beat_list])
-            last_beat_frame = 0
-            while True:
-                if measure_time_to_position_y_at_frame(last_beat_measure_time, last_beat_frame) > self._display_height:
-                    break
-                last_beat_frame += 1
-            return last_beat_frame + PRECOMPUTED_ADDITIONAL_SECONDS*PRECOMPUTED_FPS
-
-        def get_display_for_frame(frame):
-            displayed_beats_with_nones = [get_displayed_beat_for_frame(beat, beat_index, frame) for beat_index, beat in enumerate(beat_list)]
-            return list(filter(lambda displayed_beat: displayed_beat, displayed_beats_with_nones))
-
-        def get_displayed_beat_for_frame(beat, beat_index, frame):
-            if beat.variant == DDR_BEAT_VARIANT_HOLD_END:
-                return None # Display will be handled by the start of the hold note
-            position_y = measure_time_to_position_y_at_frame(beat.measure_time, frame)
-            if beat.variant == DDR_BEAT_VARIANT_HOLD_START or beat.variant == DDR_BEAT_VARIANT_ROLL_START:
-                position_y_hold_end = measure_time_to_position_y_at_frame(get_beat_hold_end_for_hold_start(beat, beat_index).measure_time, frame)
-            else:
-                position_y_hold_end = None
-            if not is_position_y_in_display(position_y, position_y_hold_end):
-                return None
-            return DisplayedBeat(
-                rgb=beat.rgb,
-                direction=beat.direction,
-                variant=beat.variant,
-                position_y=position_y,
-                position_y_hold_end=position_y_hold_end,
-            )
-
-        def get_beat_hold_end_for_hold_start(beat, beat_index):
-            assert(beat.variant == DDR_BEAT_VARIANT_HOLD_START or beat.variant == DDR_BEAT_VARIANT_ROLL_START)
-            for next_beat in beat_list[beat_index+1:]:
-                if next_beat.variant == DDR_BEAT_VARIANT_HOLD_END and next_beat.direction == beat.direction:
-                    return next_beat
-            assert(False)
-
-        def is_position_y_in_display(position_y, position_y_hold_end):
-            if position_y >= -ARROW_SIZE and position_y <= self._display_height:
-                return True
-            if not position_y_hold_end:
-                return False
-            if position_y_hold_end >= -ARROW_SIZE and position_y_hold_end <= self._display_height:
-                return True
-            if position_y > self._display_height and position_y_hold_end < -ARROW_SIZE:
-                return True
-            return False
-
-        return [get_display_for_frame(frame) for frame in range(get_last_frame_to_precompute())]
-
+    @abc.abstractmethod
     def start_main_loop(self):
-        glutDisplayFunc(self._display_func)
-        glutIdleFunc(self._display_func)
-        glutKeyboardFunc(self._keyboard_func)
-        glutMainLoop()
+        pass
+
+    # Asks for [_display_func] to be called, which otherwise only happens every frame once the song is started
+    @abc.abstractmethod
+    def _request_redisplay(self):
+        pass
+
+    # Called once the song is started, after which [_display_func] has to be called every frame, and
+    # [_frame_scheduler.frame_rendered] after every frame
+    @abc.abstractmethod
+    def _start_frames(self):
+        pass
+
+    @abc.abstractmethod
+    def _create_chart_renderer(self):
+        pass
+
+    @abc.abstractmethod
+    def _clear_display(self):
+        pass
+
+    @abc.abstractmethod
+    def _swap_buffers(self):
+        pass
+
+    @abc.abstractmethod
+    def _profile_hud(self):
+        pass
+
+    @abc.abstractmethod
+    def _close_window(self):
+        pass
+
+    # Called last when exiting
+    @abc.abstractmethod
+    def _leave_main_loop(self):
+        pass
+
+    # Windows are not thread safe, so the loader is polled from the main loop instead of calling back into it.
+    # Returns whether the loader is done, even if it failed.
+    def _poll_chart_layout_loader(self):
+        if self._chart_layout_loader.error():
+            print(f'⚠️ Could not load the chart ({self._chart_layout_loader.error()})')
+            self._quit() # Nothing to play
+            return True
+        if not self._chart_layout_loader.is_ready():
+            return False
+        self._chart_layout = self._chart_layout_loader.chart_layout()
+        self._chart_renderer = self._create_chart_renderer()
+        print(f'✅ Chart loaded! ({round(self._chart_layout_loader.load_seconds(), 1)}s)')
+        self._request_redisplay()
+        if self._start_when_loaded:
+            self._start_song()
+        return True
 
     def _start_song(self):
+        if not self._chart_renderer:
+            print('⏳️ Still loading the chart...')
+            return
+        time_stretched_music = self._time_stretched_music()
+        if time_stretched_music.error():
+            print(f'⚠️ Could not change the playback rate ({time_stretched_music.error()})')
+            return
+        if not time_stretched_music.is_ready():
+            print(f'⏳️ Still time-stretching the music ({round(time_stretched_music.progress() * 100)}%)...')
+            return
+        if time_stretched_music.filepath() != self._loaded_music_filepath:
+            pygame.mixer.music.load(time_stretched_music.filepath())
+            self._loaded_music_filepath = time_stretched_music.filepath()
+        if not self._started:
+            # Everything loaded so far lives until the song is over, so it is moved out of the garbage collector's
+            # reach; otherwise a full collection would go through all of it, which takes about a frame. This is done
+            # before the music starts, since the collection itself can take a while
+            gc.collect()
+            gc.freeze()
         pygame.mixer.music.play()
+        self._playback_clock.start()
+        if not self._started:
+            self._frame_scheduler.start()
+            self._start_frames()
         self._started = True
 
+    def _playback_rate(self):
+        return PLAYBACK_RATE_OPTIONS[self._playback_rate_index]
+
+    # Only the audio is restarted, since everything displayed is looked up from the chart time every frame
+    def _seek_to_chart_time(self, chart_time_seconds):
+        playback_time_seconds = max(get_playback_time_seconds(chart_time_seconds, self._playback_rate(), self._beatmap_music_offset, self._song_music_offset, self._custom_offset), 0)
+        pygame.mixer.music.play(start=playback_time_seconds)
+        self._playback_clock.start(playback_time_seconds)
+
+    # Fractional measure at the target arrows, where the first measure is 0
+    def _current_measure(self):
+        return self._chart_layout.timing.pixel_distance_until_time(self._chart_time_seconds())
+
+    def _measure_time_seconds(self, measure):
+        return self._chart_layout.timing.time_until_pixel_distance(measure)
+
+    # Seeks to the start of the next (or previous) measures, not past the last note
+    def _seek_measures(self, measure_count_change):
+        current_measure = self._current_measure()
+        if measure_count_change > 0:
+            measure = math.floor(current_measure + SEEK_MEASURE_TOLERANCE) + measure_count_change
+        else:
+            measure = max(math.ceil(current_measure - SEEK_MEASURE_TOLERANCE) + measure_count_change, 0)
+        measure_time_seconds = self._measure_time_seconds(measure)
+        if measure_time_seconds > self._chart_layout.end_time_seconds():
+            return
+        self._seek_to_chart_time(measure_time_seconds)
+        print(f'⏩ Measure {measure + 1}')
+
+    def _set_loop_start(self):
+        self._loop_start_measure = math.floor(self._current_measure() + SEEK_MEASURE_TOLERANCE)
+        self._print_loop()
+
+    def _set_loop_end(self):
+        self._loop_end_measure = max(math.ceil(self._current_measure() - SEEK_MEASURE_TOLERANCE), 1)
+        self._print_loop()
+
+    def _clear_loop(self):
+        self._loop_start_measure = None
+        self._loop_end_measure = None
+        print('🔁 Loop cleared')
+
+    def _is_looping(self):
+        return self._loop_start_measure is not None and self._loop_end_measure is not None and self._loop_start_measure < self._loop_end_measure
+
+    def _print_loop(self):
+        loop_start = '?' if self._loop_start_measure is None else self._loop_start_measure + 1
+        loop_end = '?' if self._loop_end_measure is None else self._loop_end_measure
+        print(f'🔁 Loop: measures {loop_start} to {loop_end}' + ('' if self._is_looping() or None in (self._loop_start_measure, self._loop_end_measure) else ' (the end has to be after the start)'))
+
+    # Checked every frame, so the loop overshoots its end by at most a frame
+    def _maybe_loop(self):
+        if self._is_looping() and self._chart_time_seconds() >= self._measure_time_seconds(self._loop_end_measure):
+            self._seek_to_chart_time(self._measure_time_seconds(self._loop_start_measure))
+
+    # Music for other playback rates is stretched in the background as soon as the rate is chosen
+    def _time_stretched_music(self):
+        playback_rate = self._playback_rate()
+        if playback_rate not in self._time_stretched_musics:
+            self._time_stretched_musics[playback_rate] = TimeStretchedMusic(self._song_music_filepath, playback_rate)
+        return self._time_stretched_musics[playback_rate]
+
+    def _change_playback_rate(self, playback_rate_index_change):
+        self._playback_rate_index = min(max(self._playback_rate_index + playback_rate_index_change, 0), len(PLAYBACK_RATE_OPTIONS) - 1)
+        is_ready = self._time_stretched_music().is_ready()
+        print(f'🎚️ Playback rate: {self._playback_rate()}x' + ('' if is_ready else ' (time-stretching the music...)'))
+
+    def _change_measure_height(self, measure_height_index_change):
+        self._measure_height_index = min(max(self._measure_height_index + measure_height_index_change, 0), len(MEASURE_HEIGHT_OPTIONS) - 1)
+        print(f'📏 Measure height: {MEASURE_HEIGHT_OPTIONS[self._measure_height_index]}')
+        if not self._chart_renderer:
+            return
+        self._chart_renderer.set_measure_height(MEASURE_HEIGHT_OPTIONS[self._measure_height_index])
+        if not self._started:
+            self._request_redisplay()
+
     def _keyboard_func(self, key, x, y):
         if key == b' ' or key == b'\r':
             self._start_song()
+        elif key == b'[' and not self._started:
+            self._change_playback_rate(-1)
+        elif key == b']' and not self._started:
+            self._change_playback_rate(1)
+        elif key == b'-':
+            self._change_measure_height(-1)
+        elif key == b'=':
+            self._change_measure_height(1)
         elif key == b'h' and self._started:
             self._custom_offset -= 0.01
             print(f'🔄 Custom offset: {self._custom_offset:.3f}s')
@@ -534,18 +1903,28 @@ class DDRWindow:
         elif key == b'l' and self._started:
             self._custom_offset += 0.01
             print(f'🔄 Custom offset: {self._custom_offset:.3f}s')
+        elif key == b',' and self._started:
+            self._seek_measures(-SEEK_MEASURE_COUNT)
+        elif key == b'.' and self._started:
+            self._seek_measures(SEEK_MEASURE_COUNT)
+        elif key == b'<' and self._started:
+            self._seek_measures(-SEEK_MEASURE_COUNT_LARGE)
+        elif key == b'>' and self._started:
+            self._seek_measures(SEEK_MEASURE_COUNT_LARGE)
+        elif key == b'a' and self._started:
+            self._set_loop_start()
+        elif key == b'b' and self._started:
+            self._set_loop_end()
+        elif key == b'c' and self._started:
+            self._clear_loop()
+        elif key == b'p' and profiler.enabled:
+            self._is_profile_hud_shown = not self._is_profile_hud_shown
+            self._request_redisplay()
         elif key == b'q':
             self._exit()
 
     def _get_custom_offset_from_file(self):
-        if os.path.exists(self._custom_offset_filepath):
-            with open(self._custom_offset_filepath) as f:
-                try:
-                    return float(f.read())
-                except ValueError:
-                    return 0
-        else:
-            return 0
+        return get_custom_offset(self._custom_offset_filepath)
 
     def _maybe_save_custom_offset(self):
         initial_custom_offset = self._get_custom_offset_from_file()
@@ -555,206 +1934,270 @@ class DDRWindow:
                 with open(self._custom_offset_filepath, 'w') as f:
                     f.write(str(round(self._custom_offset, 3)))
 
-    def _music_offset_seconds(self):
-        return GLOBAL_MUSIC_OFFSET_SECONDS - (self._beatmap_music_offset if self._beatmap_music_offset else self._song_music_offset) + self._custom_offset
+    def _chart_time_seconds(self):
+        return get_chart_time_seconds(self._playback_clock.time_seconds(), self._playback_rate(), self._beatmap_music_offset, self._song_music_offset, self._custom_offset)
 
     def _exit(self):
         if not self._started:
             return
         pygame.mixer.music.stop()
+        self._close_window()
         pygame.quit()
-        glutDestroyWindow(self._window)
+        self._print_playback_clock_statistics()
+        self._print_frame_scheduler_statistics()
+        if profiler.enabled:
+            profiler.save_report(PROFILE_REPORT_FILENAME)
+            print(f'📊 Profile report saved to {PROFILE_REPORT_FILENAME}')
         self._maybe_save_custom_offset()
-        # Forceful exit is unfortunately needed since there is no way to leave the GLUT main loop otherwise
-        # ([sys.exit()] or [raise SystemExit] both result in segmentation faults)
-        # https://www.gamedev.net/forums/topic/376112-terminating-a-glut-loop-inside-a-program/3482380/
-        # https://stackoverflow.com/a/35430500
-        os._exit(0)
+        self._leave_main_loop()
+
+    def _print_playback_clock_statistics(self):
+        playback_clock_statistics = self._playback_clock.statistics()
+        if not playback_clock_statistics:
+            return
+        print(f'⏱️ Audio start latency: {playback_clock_statistics["latency_ms"]:.1f}ms, jitter: {playback_clock_statistics["jitter_ms"]:.1f}ms (mean error {playback_clock_statistics["mean_error_ms"]:.1f}ms over {playback_clock_statistics["sample_count"]} updates, {playback_clock_statistics["resync_count"]} resyncs)')
+
+    def _print_frame_scheduler_statistics(self):
+        frame_scheduler_statistics = self._frame_scheduler.statistics()
+        if not frame_scheduler_statistics:
+            return
+        print(f'🎞️ Rendered {frame_scheduler_statistics["rendered_frame_count"]} frames ({frame_scheduler_statistics["average_fps"]:.1f} fps on average), dropped {frame_scheduler_statistics["dropped_frame_count"]}')
 
     def _display_func(self):
         if self._started and not pygame.mixer.music.get_busy(): # Song is over!
             self._exit()
-        self._display_reset()
-        self._target_arrows()
-        self._moving_arrows(pygame.mixer.music.get_pos() / MILLISECONDS_IN_SECONDS - self._music_offset_seconds())
-        glutSwapBuffers()
+            return
+        if self._started:
+            self._maybe_loop()
+        if not self._chart_renderer: # Still loading the chart
+            self._clear_display()
+            self._swap_buffers()
+            return
+        profiler.frame_started()
+        with profiler.timer('draw'):
+            note_count = self._chart_renderer.render(self._chart_time_seconds())
+        if self._is_profile_hud_shown:
+            self._profile_hud()
+        with profiler.timer('swap'):
+            self._swap_buffers()
+        profiler.frame_ended(note_count)
+        if not self._first_frame_drawn:
+            self._first_frame_drawn = True
+            print(f'🖼️ First frame drawn {round(time.perf_counter() - STARTUP_PERF_TIME, 2)}s after startup')
+            if self._quit_after_first_frame:
+                self._quit()
+
+    # Leaves without having played, so unlike [_exit], there is nothing to report or save
+    def _quit(self):
+        pygame.mixer.music.stop()
+        self._close_window()
+        pygame.quit()
+        self._leave_main_loop()
 
-    def _display_reset(self):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glLoadIdentity()
+class GlutDDRWindow(DDRWindow):
+    def __init__(self, *args, position_x=POSITION_X, position_y=POSITION_Y, display_width=DISPLAY_WIDTH, display_height=DISPLAY_HEIGHT, vsync=VSYNC_DEFAULT, chart_renderer_name=CHART_RENDERER_DEFAULT, **kwargs):
+        import_gl()
+        glutInit()
+        glutInitDisplayMode(GLUT_RGBA | GLUT_DOUBLE)
+        glutInitWindowPosition(position_x, position_y)
+        glutInitWindowSize(display_width, display_height)
+        self._window = glutCreateWindow("D/DR")
+        if not set_swap_interval(1 if vsync else 0) and vsync:
+            print('⚠️ Could not enable vsync, frames are only paced by the frame rate cap')
+        self._chart_renderer_name = chart_renderer_name
+        super().__init__(*args, position_x=position_x, position_y=position_y, display_width=display_width, display_height=display_height, **kwargs)
 
-        glViewport(
-            self._position_x, # x
-            self._position_y, # y
-            self._display_width, # width
-            self._display_height, # height
-        )
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
+    # Until the song is started, nothing moves, so the window is only redrawn when GLUT asks for it (or once the
+    # chart layout is loaded)
+    def start_main_loop(self):
+        glutDisplayFunc(self._display_func)
+        glutKeyboardFunc(self._keyboard_func)
+        print('⏳️ Loading the chart...')
+        self._chart_layout_loader_timer_func(0)
+        glutMainLoop()
 
-        glOrtho(
-            self._position_x, # left
-            self._position_x + self._display_width, # right
-            self._position_y, # bottom
-            self._position_y + self._display_height, # top
-            0.0, # near_val
-            1.0, # far_val
-        )
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
+    def _chart_layout_loader_timer_func(self, value):
+        if not self._poll_chart_layout_loader():
+            glutTimerFunc(CHART_LAYOUT_LOADER_POLL_INTERVAL_MILLISECONDS, self._chart_layout_loader_timer_func, 0)
 
-    def _target_arrows(self):
-        self._arrow(rgb=WHITE_RGB, direction=BeatDirection.LEFT, position_y=self._arrow_target_position_y, is_outline_only=True)
-        self._arrow(rgb=WHITE_RGB, direction=BeatDirection.DOWN, position_y=self._arrow_target_position_y, is_outline_only=True)
-        self._arrow(rgb=WHITE_RGB, direction=BeatDirection.UP, position_y=self._arrow_target_position_y, is_outline_only=True)
-        self._arrow(rgb=WHITE_RGB, direction=BeatDirection.RIGHT, position_y=self._arrow_target_position_y, is_outline_only=True)
+    def _request_redisplay(self):
+        glutPostRedisplay()
 
-    def _moving_arrows(self, current_time):
-        current_frame = int(current_time * PRECOMPUTED_FPS)
-        displayed_beats = self._precomputed_displays[current_frame] if current_frame < len(self._precomputed_displays) else []
-        for displayed_beat in displayed_beats:
-            if displayed_beat.variant == DDR_BEAT_VARIANT_DEFAULT:
-                self._arrow(rgb=displayed_beat.rgb, direction=displayed_beat.direction, position_y=displayed_beat.position_y)
-            elif displayed_beat.variant == DDR_BEAT_VARIANT_HOLD_START or displayed_beat.variant == DDR_BEAT_VARIANT_ROLL_START:
-                self._hold_background(rgb=displayed_beat.rgb, direction=displayed_beat.direction, position_y=displayed_beat.position_y, position_y_hold_end=displayed_beat.position_y_hold_end)
-                self._arrow(rgb=displayed_beat.rgb, direction=displayed_beat.direction, position_y=displayed_beat.position_y)
-                self._arrow(rgb=displayed_beat.rgb, direction=displayed_beat.direction, position_y=displayed_beat.position_y_hold_end, is_outline_only=True)
-            elif displayed_beat.variant == DDR_BEAT_VARIANT_MINE:
-                self._mine(direction=displayed_beat.direction, position_y=displayed_beat.position_y)
-            else:
-                assert(False)
+    def _start_frames(self):
+        self._schedule_next_frame()
 
-    def _arrow(self, rgb, direction, position_y, is_outline_only=False):
-        position_x = self._position_x_from_direction(direction)
-        rotation_angle_degrees = self._rotation_angle_degrees_from_direction(direction)
+    # GLUT timers only have millisecond resolution, so the rest of the wait is slept in [_frame_timer_func]
+    def _schedule_next_frame(self):
+        glutTimerFunc(math.floor(self._frame_scheduler.seconds_until_next_frame() * MILLISECONDS_IN_SECONDS), self._frame_timer_func, 0)
 
-        glPushMatrix()
-        glTranslatef(
-            position_x + ARROW_SIZE/2, # x
-            position_y + ARROW_SIZE/2, # y
-            0, # z
-        )
-        glRotatef(
-            rotation_angle_degrees, # angle
-            0, # x
-            0, # y
-            1, # z
-        )
-        glTranslatef(
-            -ARROW_SIZE/2, # x
-            -ARROW_SIZE/2, # y
-            0, # z
-        )
+    def _frame_timer_func(self, value):
+        time.sleep(self._frame_scheduler.seconds_until_next_frame())
+        self._display_func()
+        self._frame_scheduler.frame_rendered()
+        self._schedule_next_frame()
 
-        glColor4f(*rgb, OUTLINE_ALPHA if is_outline_only else 1.0)
-
-        glBegin(GL_LINE_LOOP if is_outline_only else GL_POLYGON)
-        glVertex2f(ARROW_DIAGONAL_WIDTH + ARROW_DIAGONAL_WIDTH/2, ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH + ARROW_DIAGONAL_WIDTH/2)
-        glVertex2f(ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH/2                       )
-        glVertex2f(ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 + ARROW_DIAGONAL_WIDTH/2                       )
-        glVertex2f(ARROW_SIZE/2                                 , ARROW_SIZE                                                  )
-        glVertex2f(ARROW_SIZE/2 + ARROW_DIAGONAL_WIDTH          , ARROW_SIZE - ARROW_DIAGONAL_WIDTH                           )
-        glEnd()
-
-        glBegin(GL_LINE_LOOP if is_outline_only else GL_POLYGON)
-        glVertex2f(ARROW_SIZE - ARROW_DIAGONAL_WIDTH - ARROW_DIAGONAL_WIDTH/2, ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH + ARROW_DIAGONAL_WIDTH/2)
-        glVertex2f(ARROW_SIZE - ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH/2                       )
-        glVertex2f(ARROW_SIZE - ARROW_DIAGONAL_WIDTH/2                       , ARROW_SIZE/2 + ARROW_DIAGONAL_WIDTH/2                       )
-        glVertex2f(ARROW_SIZE/2                                              , ARROW_SIZE                                                  )
-        glVertex2f(ARROW_SIZE/2 - ARROW_DIAGONAL_WIDTH                       , ARROW_SIZE - ARROW_DIAGONAL_WIDTH                           )
-        glEnd()
-
-        glBegin(GL_LINE_LOOP if is_outline_only else GL_POLYGON)
-        glVertex2f(ARROW_SIZE/2 - ARROW_STRAIGHT_WIDTH/2, ARROW_SIZE - ARROW_DIAGONAL_WIDTH)
-        glVertex2f(ARROW_SIZE/2 + ARROW_STRAIGHT_WIDTH/2, ARROW_SIZE - ARROW_DIAGONAL_WIDTH)
-        glVertex2f(ARROW_SIZE/2 + ARROW_STRAIGHT_WIDTH/2, ARROW_STRAIGHT_WIDTH/2           )
-        glVertex2f(ARROW_SIZE/2                         , 0                                )
-        glVertex2f(ARROW_SIZE/2 - ARROW_STRAIGHT_WIDTH/2, ARROW_STRAIGHT_WIDTH/2           )
-        glEnd()
-
-        glPopMatrix()
-
-    def _hold_background(self, rgb, direction, position_y, position_y_hold_end):
-        position_x = self._position_x_from_direction(direction)
-        rotation_angle_degrees = self._rotation_angle_degrees_from_direction(direction)
-        position_y_hold_end_delta = position_y_hold_end - position_y
-
-        glPushMatrix()
-        glTranslatef(
-            position_x, # x
-            position_y, # y
-            0, # z
-        )
+    # Renderers that need more than OpenGL 1.1 fall back to the default one if the driver does not support them
+    def _create_chart_renderer(self):
+        chart_renderer_kwargs = dict(measure_height=MEASURE_HEIGHT_OPTIONS[self._measure_height_index], position_x=self._position_x, position_y=self._position_y, display_width=self._display_width, display_height=self._display_height)
+        try:
+            return CHART_RENDERER_CLASSES[self._chart_renderer_name](self._chart_layout, **chart_renderer_kwargs)
+        except (RuntimeError, NullFunctionError) as e:
+            print(f'⚠️ Could not use the {self._chart_renderer_name} renderer, falling back to {CHART_RENDERER_DEFAULT} ({e})')
+            return CHART_RENDERER_CLASSES[CHART_RENDERER_DEFAULT](self._chart_layout, **chart_renderer_kwargs)
 
-        glColor4f(*rgb, HOLD_ALPHA)
+    def _clear_display(self):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        glBegin(GL_POLYGON)
-        glVertex2f(0         , ARROW_SIZE               )
-        glVertex2f(ARROW_SIZE, ARROW_SIZE               )
-        glVertex2f(ARROW_SIZE, position_y_hold_end_delta)
-        glVertex2f(0         , position_y_hold_end_delta)
-        glEnd()
+    def _swap_buffers(self):
+        glutSwapBuffers()
 
-        glPopMatrix()
+    def _profile_hud(self):
+        glColor4f(*WHITE_RGB, OUTLINE_ALPHA)
+        for line_index, line in enumerate(profiler.hud_lines()):
+            glRasterPos2f(self._position_x + PROFILE_HUD_MARGIN, self._position_y + self._display_height - PROFILE_HUD_MARGIN - (line_index + 1) * PROFILE_HUD_LINE_HEIGHT)
+            for character in line:
+                glutBitmapCharacter(GLUT_BITMAP_HELVETICA_12, ord(character))
 
-    def _mine(self, direction, position_y):
-        position_x = self._position_x_from_direction(direction)
+    def _close_window(self):
+        glutDestroyWindow(self._window)
 
-        glPushMatrix()
-        glTranslatef(
-            position_x, # x
-            position_y, # y
-            0, # z
-        )
+    # Forceful exit is unfortunately needed since there is no way to leave the GLUT main loop otherwise
+    # ([sys.exit()] or [raise SystemExit] both result in segmentation faults)
+    # https://www.gamedev.net/forums/topic/376112-terminating-a-glut-loop-inside-a-program/3482380/
+    # https://stackoverflow.com/a/35430500
+    def _leave_main_loop(self):
+        os._exit(0)
 
-        glColor3f(*ORANGE_RGB)
+# Draws with [SpriteChartRenderer], so it runs without OpenGL
+class PygameDDRWindow(DDRWindow):
+    def __init__(self, *args, position_x=POSITION_X, position_y=POSITION_Y, display_width=DISPLAY_WIDTH, display_height=DISPLAY_HEIGHT, **kwargs):
+        os.environ['SDL_VIDEO_WINDOW_POS'] = f'{position_x},{position_y}'
+        import_pygame()
+        pygame.display.init()
+        pygame.display.set_caption("D/DR")
+        self._screen = pygame.display.set_mode((display_width, display_height))
+        self._is_main_loop_running = False
+        self._is_redisplay_requested = False
+        self._profile_hud_font = None # Loaded the first time the HUD is shown
+        super().__init__(*args, position_x=position_x, position_y=position_y, display_width=display_width, display_height=display_height, **kwargs)
+
+    # Until the song is started, nothing moves, so the window is only redrawn when asked for (or once the chart layout is
+    # loaded), and otherwise only polls events
+    def start_main_loop(self):
+        print('⏳️ Loading the chart...')
+        is_chart_layout_loader_done = False
+        self._is_main_loop_running = True
+        while self._is_main_loop_running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    if self._started:
+                        self._exit()
+                    else:
+                        pygame.quit()
+                        self._leave_main_loop()
+                elif event.type == pygame.KEYDOWN and event.unicode:
+                    self._keyboard_func(event.unicode.encode(), 0, 0)
+                elif event.type == pygame.WINDOWEXPOSED:
+                    self._request_redisplay()
+                if not self._is_main_loop_running:
+                    return
+            if not is_chart_layout_loader_done:
+                is_chart_layout_loader_done = self._poll_chart_layout_loader()
+                if not self._is_main_loop_running:
+                    return
+            if self._started:
+                time.sleep(self._frame_scheduler.seconds_until_next_frame())
+                self._display_func()
+                self._frame_scheduler.frame_rendered()
+            elif self._is_redisplay_requested:
+                self._is_redisplay_requested = False
+                self._display_func()
+            else:
+                pygame.time.wait(PYGAME_IDLE_POLL_INTERVAL_MILLISECONDS)
 
-        glBegin(GL_POLYGON)
-        glVertex2f(MINE_MARGIN             , ARROW_SIZE - MINE_MARGIN)
-        glVertex2f(ARROW_SIZE - MINE_MARGIN, ARROW_SIZE - MINE_MARGIN)
-        glVertex2f(ARROW_SIZE - MINE_MARGIN, MINE_MARGIN             )
-        glVertex2f(MINE_MARGIN             , MINE_MARGIN             )
-        glEnd()
+    def _request_redisplay(self):
+        self._is_redisplay_requested = True
 
-        glColor3f(*RED_RGB)
+    def _start_frames(self):
+        pass # Frames are paced by [start_main_loop] once the song is started
 
-        glBegin(GL_POLYGON)
-        glVertex2f(ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2                         )
-        glVertex2f(ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2                         )
-        glVertex2f(ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 - MINE_EXCLAMATION_WIDTH)
-        glVertex2f(ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2, ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 - MINE_EXCLAMATION_WIDTH)
-        glEnd()
+    def _create_chart_renderer(self):
+        return SpriteChartRenderer(self._chart_layout, self._screen, measure_height=MEASURE_HEIGHT_OPTIONS[self._measure_height_index], display_width=self._display_width, display_height=self._display_height)
 
-        glBegin(GL_POLYGON)
-        glVertex2f(ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2 - MINE_EXCLAMATION_WIDTH/6, ARROW_SIZE/2 + MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH)
-        glVertex2f(ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2 + MINE_EXCLAMATION_WIDTH/6, ARROW_SIZE/2 + MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH)
-        glVertex2f(ARROW_SIZE/2 + MINE_EXCLAMATION_WIDTH/2                           , ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH)
-        glVertex2f(ARROW_SIZE/2 - MINE_EXCLAMATION_WIDTH/2                           , ARROW_SIZE/2 - MINE_EXCLAMATION_HEIGHT/2 + MINE_EXCLAMATION_WIDTH)
-        glEnd()
+    def _clear_display(self):
+        self._screen.fill((0, 0, 0))
 
-        glPopMatrix()
+    def _swap_buffers(self):
+        pygame.display.flip()
 
-    def _position_x_from_direction(self, direction):
-        match direction:
-            case BeatDirection.LEFT:
-                return self._arrow_left_position_x
-            case BeatDirection.DOWN:
-                return self._arrow_down_position_x
-            case BeatDirection.UP:
-                return self._arrow_up_position_x
-            case BeatDirection.RIGHT:
-                return self._arrow_right_position_x
+    def _profile_hud(self):
+        if not self._profile_hud_font:
+            pygame.font.init()
+            self._profile_hud_font = pygame.font.Font(None, PROFILE_HUD_LINE_HEIGHT)
+        for line_index, line in enumerate(profiler.hud_lines()):
+            self._screen.blit(self._profile_hud_font.render(line, True, get_surface_rgba(WHITE_RGB, OUTLINE_ALPHA)), (PROFILE_HUD_MARGIN, PROFILE_HUD_MARGIN + line_index * PROFILE_HUD_LINE_HEIGHT))
 
-    def _rotation_angle_degrees_from_direction(self, direction):
-        match direction:
-            case BeatDirection.LEFT:
-                return 90
-            case BeatDirection.DOWN:
-                return 180
-            case BeatDirection.UP:
+    def _close_window(self):
+        pass # Closed along with pygame
+
+    def _leave_main_loop(self):
+        self._is_main_loop_running = False
+
+def get_custom_offset(custom_offset_filepath):
+    if os.path.exists(custom_offset_filepath):
+        with open(custom_offset_filepath) as f:
+            try:
+                return float(f.read())
+            except ValueError:
                 return 0
-            case BeatDirection.RIGHT:
-                return 270
+    else:
+        return 0
+
+# At the normal playback rate, the chart is displayed at the playback time minus this offset
+def get_music_offset_seconds(beatmap_music_offset, song_music_offset, custom_offset):
+    return GLOBAL_MUSIC_OFFSET_SECONDS - (beatmap_music_offset if beatmap_music_offset else song_music_offset) + custom_offset
+
+# The global and custom offsets compensate for latency, so they are in real seconds and scaled by the playback rate
+# along with the playback time, while the simfile offsets are in song seconds
+def get_chart_time_seconds(playback_time_seconds, playback_rate, beatmap_music_offset, song_music_offset, custom_offset):
+    return playback_rate * (playback_time_seconds - GLOBAL_MUSIC_OFFSET_SECONDS - custom_offset) + (beatmap_music_offset if beatmap_music_offset else song_music_offset)
+
+# Inverse of [get_chart_time_seconds]
+def get_playback_time_seconds(chart_time_seconds, playback_rate, beatmap_music_offset, song_music_offset, custom_offset):
+    return (chart_time_seconds - (beatmap_music_offset if beatmap_music_offset else song_music_offset)) / playback_rate + GLOBAL_MUSIC_OFFSET_SECONDS + custom_offset
+
+# For rendering without a window, e.g. when benchmarking or exporting videos. EGL is only used by PyOpenGL when
+# [PYOPENGL_PLATFORM] is set to 'egl' before OpenGL is first imported (by [import_gl], so this has to come before any
+# window is created), and failures raise whatever the driver reports.
+def create_headless_gl_context(width, height):
+    if sys.platform.startswith('linux'):
+        os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+        os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+    import_gl()
+    from OpenGL import EGL
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    EGL.eglInitialize(display, ctypes.pointer(EGL.EGLint()), ctypes.pointer(EGL.EGLint()))
+    config_attributes = (EGL.EGLint * 13)(
+        EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+        EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+        EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+        EGL.EGL_NONE,
+    )
+    config = EGL.EGLConfig()
+    config_count = EGL.EGLint()
+    EGL.eglChooseConfig(display, config_attributes, ctypes.pointer(config), 1, ctypes.pointer(config_count))
+    if config_count.value == 0:
+        raise RuntimeError('No suitable EGL config')
+    surface = EGL.eglCreatePbufferSurface(display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not EGL.eglMakeCurrent(display, surface, surface, context):
+        raise RuntimeError('Could not make the EGL context current')
+
+# Top row first, as image files expect
+def read_rgb_pixels(width, height):
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    return numpy.frombuffer(glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE), dtype=numpy.uint8).reshape(height, width, 3)[::-1]
 
 ################
 # DISPLAY END
@@ -766,46 +2209,287 @@ class DDRWindow:
 
 SONG_MAIN_DIR_NAME = 'songs'
 CUSTOM_OFFSET_FILENAME = 'custom_offset.dat'
+LIBRARY_INDEX_FILENAME = 'library.db'
+LIBRARY_INDEX_VERSION = 5
+SONG_SCAN_THREAD_COUNT = 32
+SONG_SCAN_PROCESS_POOL_MIN_SIMFILES = 16 # Below this, starting the worker processes costs more than it saves
+SONG_SCAN_PROCESS_POOL_CHUNK_SIZE = 8
 
 def get_song_folder_list():
-    assert(os.path.exists(SONG_MAIN_DIR_NAME))
-    return [song_folder for song_folder in os.listdir(SONG_MAIN_DIR_NAME) if os.path.isdir(os.path.join(SONG_MAIN_DIR_NAME, song_folder))]
+    return song_library.song_folder_list()
 
 def get_song_list(song_folder):
-    song_folder_filepath = os.path.join(SONG_MAIN_DIR_NAME, song_folder)
-    song_list = []
-    for song_dir_name in os.listdir(song_folder_filepath):
-        song_dir_filepath = os.path.join(song_folder_filepath, song_dir_name)
-        if not os.path.isdir(song_dir_filepath):
-            continue
-        song = get_song(song_dir_filepath)
-        if not song:
-            print(f'⚠️ Skipping "{song_dir_name}" because it is missing the .ssc/.sm file...')
-            continue
-        song_music_filepath = os.path.join(song_dir_filepath, song.music_filename())
-        if not os.path.exists(song_music_filepath):
-            print(f'⚠️ Skipping "{song_dir_name}" because it is missing the music file...')
-            continue
-        song_custom_offset_filepath = os.path.join(song_dir_filepath, CUSTOM_OFFSET_FILENAME)
-        song_list.append((song, song_music_filepath, song_custom_offset_filepath))
-    song_list.sort(key=lambda song_and_filepaths_tuple: song_and_filepaths_tuple[0].displayed_name())
-    return song_list
+    return song_library.song_list(song_folder)
+
+class SongDirScan:
+    def __init__(self, dir_mtime_ns, simfile, song, music_filepath, music_filepath_exists):
+        self.dir_mtime_ns = dir_mtime_ns
+        self.simfile = simfile # (filepath, format, stat), or None if the song directory has no simfile
+        self.song = song
+        self.music_filepath = music_filepath
+        self.music_filepath_exists = music_filepath_exists
+
+# In-memory model of the songs directory, refreshed incrementally every time it is listed.
+# A directory's modification time only changes when entries are added to, removed from or renamed within it,
+# so pack and song directories are only re-listed when their modification time changed. Simfiles can still be
+# edited in place, so each simfile is also re-stat-ed, and only re-parsed when its modification time or size changed.
+class SongLibrary:
+    def __init__(self, song_main_dir_filepath):
+        self._song_main_dir_filepath = song_main_dir_filepath
+        self._song_folder_list_mtime_ns = None
+        self._song_folder_list = None
+        self._song_folder_mtime_ns = dict()
+        self._song_folder_song_dir_scans = dict()
+
+    def song_folder_list(self):
+        assert(os.path.exists(self._song_main_dir_filepath))
+        song_main_dir_mtime_ns = os.stat(self._song_main_dir_filepath).st_mtime_ns
+        if song_main_dir_mtime_ns != self._song_folder_list_mtime_ns:
+            self._song_folder_list = [entry.name for entry in os.scandir(self._song_main_dir_filepath) if entry.is_dir()]
+            self._song_folder_list_mtime_ns = song_main_dir_mtime_ns
+        return self._song_folder_list
+
+    # Filesystem calls are made from a thread pool, and simfiles that are not in the library index are parsed in a
+    # process pool, so that scanning a large pack uses every core
+    def song_list(self, song_folder):
+        song_folder_filepath = os.path.join(self._song_main_dir_filepath, song_folder)
+        song_folder_mtime_ns = os.stat(song_folder_filepath).st_mtime_ns
+        previous_song_dir_scans = self._song_folder_song_dir_scans.get(song_folder, dict())
+        if song_folder_mtime_ns != self._song_folder_mtime_ns.get(song_folder):
+            song_dir_filepaths = [entry.path for entry in os.scandir(song_folder_filepath) if entry.is_dir()]
+        else:
+            song_dir_filepaths = list(previous_song_dir_scans)
+
+        with concurrent.futures.ThreadPoolExecutor(SONG_SCAN_THREAD_COUNT) as thread_pool:
+            song_dir_changes = list(thread_pool.map(get_song_dir_change, song_dir_filepaths, [previous_song_dir_scans.get(song_dir_filepath) for song_dir_filepath in song_dir_filepaths]))
+            song_dir_scans = {song_dir_filepath: previous_song_dir_scans[song_dir_filepath] for song_dir_filepath, song_dir_change in zip(song_dir_filepaths, song_dir_changes) if not song_dir_change}
+            changed_song_dirs = [(song_dir_filepath, *song_dir_change) for song_dir_filepath, song_dir_change in zip(song_dir_filepaths, song_dir_changes) if song_dir_change]
+            if len(changed_song_dirs) > 0 or len(song_dir_scans) != len(previous_song_dir_scans):
+                song_dir_scans.update(self._scan_changed_song_dirs(song_folder_filepath, changed_song_dirs, song_dir_scans, thread_pool))
+        self._song_folder_mtime_ns[song_folder] = song_folder_mtime_ns
+        self._song_folder_song_dir_scans[song_folder] = song_dir_scans
+
+        song_list = []
+        skipped_song_reasons = []
+        for song_dir_filepath, song_dir_scan in song_dir_scans.items():
+            if not song_dir_scan.simfile:
+                skipped_song_reasons.append((song_dir_filepath, 'it is missing the .ssc/.sm file'))
+                continue
+            if not song_dir_scan.song:
+                skipped_song_reasons.append((song_dir_filepath, 'its .ssc/.sm file could not be parsed'))
+                continue
+            if not song_dir_scan.music_filepath_exists:
+                skipped_song_reasons.append((song_dir_filepath, 'it is missing the music file'))
+                continue
+            song_custom_offset_filepath = os.path.join(song_dir_filepath, CUSTOM_OFFSET_FILENAME)
+            song_list.append((song_dir_scan.song, song_dir_scan.music_filepath, song_custom_offset_filepath))
+        song_list.sort(key=lambda song_and_filepaths_tuple: song_and_filepaths_tuple[0].displayed_name())
+        print_skipped_songs(skipped_song_reasons)
+        return song_list
+
+    def _scan_changed_song_dirs(self, song_folder_filepath, changed_song_dirs, unchanged_song_dir_scans, thread_pool):
+        songs = dict()
+        with SongLibraryIndex(os.path.join(self._song_main_dir_filepath, LIBRARY_INDEX_FILENAME)) as song_library_index:
+            unindexed_song_simfiles = []
+            for song_dir_filepath, _, song_simfile in changed_song_dirs:
+                if not song_simfile:
+                    continue
+                song_record = song_library_index.get_song_record(*song_simfile)
+                if song_record:
+                    songs[song_dir_filepath] = get_song_from_record(song_simfile[0], song_record)
+                else:
+                    unindexed_song_simfiles.append((song_dir_filepath, song_simfile))
+            song_records = parse_simfile_records([song_simfile[:2] for _, song_simfile in unindexed_song_simfiles])
+            for (song_dir_filepath, song_simfile), song_record in zip(unindexed_song_simfiles, song_records):
+                if not song_record:
+                    continue # Parsed again once the simfile changes
+                song_library_index.add_song_record(*song_simfile, song_record)
+                songs[song_dir_filepath] = get_song_from_record(song_simfile[0], song_record)
+            song_simfile_filepaths = [song_simfile[0] for _, _, song_simfile in changed_song_dirs if song_simfile] + [song_dir_scan.simfile[0] for song_dir_scan in unchanged_song_dir_scans.values() if song_dir_scan.simfile]
+            song_library_index.remove_songs_not_in(song_folder_filepath, song_simfile_filepaths)
+
+        song_music_filepaths = {song_dir_filepath: os.path.join(song_dir_filepath, song.music_filename()) for song_dir_filepath, song in songs.items()}
+        song_music_filepath_exists = dict(zip(song_music_filepaths, thread_pool.map(os.path.exists, song_music_filepaths.values())))
+        return {
+            song_dir_filepath: SongDirScan(
+                dir_mtime_ns=song_dir_mtime_ns,
+                simfile=song_simfile,
+                song=songs.get(song_dir_filepath),
+                music_filepath=song_music_filepaths.get(song_dir_filepath),
+                music_filepath_exists=song_music_filepath_exists.get(song_dir_filepath, False),
+            )
+            for song_dir_filepath, song_dir_mtime_ns, song_simfile in changed_song_dirs
+        }
+
+# Returns None if the song directory is unchanged since [previous_song_dir_scan], otherwise the directory's new
+# modification time and simfile
+def get_song_dir_change(song_dir_filepath, previous_song_dir_scan):
+    song_dir_mtime_ns = os.stat(song_dir_filepath).st_mtime_ns
+    if previous_song_dir_scan and previous_song_dir_scan.dir_mtime_ns == song_dir_mtime_ns:
+        if not previous_song_dir_scan.simfile:
+            return None
+        simfile_filepath, file_format, previous_simfile_stat = previous_song_dir_scan.simfile
+        simfile_stat = os.stat(simfile_filepath)
+        if (simfile_stat.st_mtime_ns, simfile_stat.st_size) == (previous_simfile_stat.st_mtime_ns, previous_simfile_stat.st_size):
+            return None
+        return song_dir_mtime_ns, (simfile_filepath, file_format, simfile_stat)
+    return song_dir_mtime_ns, get_song_simfile_with_stat(song_dir_filepath)
+
+def print_skipped_songs(skipped_song_reasons):
+    if len(skipped_song_reasons) == 0:
+        return
+    print(f'⚠️ Skipping {len(skipped_song_reasons)} song(s):')
+    for song_dir_filepath, reason in sorted(skipped_song_reasons):
+        print(f'    "{os.path.basename(song_dir_filepath)}" because {reason}...')
 
 def get_song(song_dir_filepath):
-    song_ssc_filename = next(filter(lambda file: file.lower().endswith('.ssc'), os.listdir(song_dir_filepath)), None)
-    song_sm_filename = next(filter(lambda file: file.lower().endswith('.sm'), os.listdir(song_dir_filepath)), None)
+    simfile_filepath_and_format = get_song_simfile(song_dir_filepath)
+    if not simfile_filepath_and_format:
+        return None
+    return parse_simfile(*simfile_filepath_and_format)
+
+# For launching a song directly, without scanning its pack. Takes a simfile or the song directory containing it, and
+# returns the song along with its music and custom offset filepaths, or None if there is no simfile.
+def get_song_with_filepaths(simfile_or_song_dir_filepath):
+    if os.path.isdir(simfile_or_song_dir_filepath):
+        song_dir_filepath = simfile_or_song_dir_filepath
+        simfile_filepath_and_format = get_song_simfile(song_dir_filepath)
+    else:
+        song_dir_filepath = os.path.dirname(simfile_or_song_dir_filepath)
+        file_format = os.path.splitext(simfile_or_song_dir_filepath)[1].lower()
+        simfile_filepath_and_format = (simfile_or_song_dir_filepath, file_format) if os.path.isfile(simfile_or_song_dir_filepath) and file_format in ['.ssc', '.sm'] else None
+    if not simfile_filepath_and_format:
+        return None
+    song = parse_simfile(*simfile_filepath_and_format, lazy_notes=True) # Beatmaps keep their simfile, which the chart layout cache is keyed on
+    return song, os.path.join(song_dir_filepath, song.music_filename()), os.path.join(song_dir_filepath, CUSTOM_OFFSET_FILENAME)
+
+def get_song_simfile(song_dir_filepath):
+    song_dir_filenames = os.listdir(song_dir_filepath)
+    song_ssc_filename = next(filter(lambda file: file.lower().endswith('.ssc'), song_dir_filenames), None)
+    song_sm_filename = next(filter(lambda file: file.lower().endswith('.sm'), song_dir_filenames), None)
     if song_ssc_filename:
-        song_ssc_filepath = os.path.join(song_dir_filepath, song_ssc_filename)
-        with open(song_ssc_filepath) as f:
-            return parse(f.readlines(), '.ssc')
+        return os.path.join(song_dir_filepath, song_ssc_filename), '.ssc'
     elif song_sm_filename:
         # .sm is the legacy file format (https://www.reddit.com/r/Stepmania/comments/a1arfu/difference_between_sm_and_ssc_file_types/)
-        song_sm_filepath = os.path.join(song_dir_filepath, song_sm_filename)
-        with open(song_sm_filepath) as f:
-            return parse(f.readlines(), '.sm')
+        return os.path.join(song_dir_filepath, song_sm_filename), '.sm'
     else:
         return None
 
+def get_song_simfile_with_stat(song_dir_filepath):
+    simfile_filepath_and_format = get_song_simfile(song_dir_filepath)
+    if not simfile_filepath_and_format:
+        return None
+    return *simfile_filepath_and_format, os.stat(simfile_filepath_and_format[0])
+
+# With [lazy_notes], only headers and chart metadata are decoded (see [parse])
+# Simfiles parsed in worker processes while scanning the library are profiled by the workers' own profilers, which are discarded
+def parse_simfile(simfile_filepath, file_format, lazy_notes=False):
+    with profiler.timer('parse'), open(simfile_filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: # Empty files cannot be memory-mapped
+            return parse(b'', file_format)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return parse(buffer, file_format, simfile_filepath=simfile_filepath if lazy_notes else None)
+
+# Song records only hold plain data, so they can be stored in the library index and passed between processes.
+# Analytics of the DDR charts are computed here as well, so that they are computed in the process pool too.
+# Returns None if the simfile could not be parsed, so that one broken simfile does not fail the whole listing
+def parse_simfile_record(simfile_filepath, file_format):
+    try:
+        song = parse_simfile(simfile_filepath, file_format, lazy_notes=True)
+    except ParseError:
+        return None
+    return {
+        'header_data': song.header_data(),
+        'beatmaps': [{'title_line': beatmap.title_line(), 'data': beatmap.metadata(), 'notes_byte_range': beatmap.notes_byte_range(), 'analytics': get_beatmap_analytics(song, beatmap)} for beatmap in song.beatmap_list()],
+    }
+
+def get_beatmap_analytics(song, beatmap):
+    if not beatmap.is_ddr_beatmap():
+        return None
+    try:
+        return song.beatmap_analytics(beatmap)
+    except ParseError:
+        return None # Reported when the chart is chosen (along with headers that the timing does not support yet)
+
+def parse_simfile_records(simfile_filepaths_and_formats):
+    if len(simfile_filepaths_and_formats) < SONG_SCAN_PROCESS_POOL_MIN_SIMFILES:
+        return [parse_simfile_record(*simfile_filepath_and_format) for simfile_filepath_and_format in simfile_filepaths_and_formats]
+    with concurrent.futures.ProcessPoolExecutor() as process_pool:
+        simfile_filepaths, file_formats = zip(*simfile_filepaths_and_formats)
+        return list(process_pool.map(parse_simfile_record, simfile_filepaths, file_formats, chunksize=SONG_SCAN_PROCESS_POOL_CHUNK_SIZE))
+
+def get_song_from_record(simfile_filepath, song_record):
+    beatmap_list = [
+        Beatmap(
+            title_line=beatmap['title_line'],
+            data=beatmap['data'],
+            simfile_filepath=simfile_filepath if beatmap['notes_byte_range'] else None,
+            notes_byte_range=tuple(beatmap['notes_byte_range']) if beatmap['notes_byte_range'] else None,
+            analytics=beatmap['analytics'],
+        )
+        for beatmap in song_record['beatmaps']
+    ]
+    return Song(header_data=song_record['header_data'], beatmap_list=beatmap_list)
+
+# Caches the song records of every parsed simfile (headers and chart metadata, but not the notes, which are only
+# located), keyed by the simfile's path, modification time and size, so that listing songs only re-parses simfiles
+# that changed
+class SongLibraryIndex:
+    def __init__(self, index_filepath):
+        self._connection = sqlite3.connect(index_filepath)
+        (index_version,) = self._connection.execute('PRAGMA user_version').fetchone()
+        if index_version != LIBRARY_INDEX_VERSION:
+            self._connection.execute('DROP TABLE IF EXISTS songs')
+            self._connection.execute(f'PRAGMA user_version = {LIBRARY_INDEX_VERSION}')
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS songs (
+                simfile_filepath TEXT PRIMARY KEY,
+                file_format TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                header_data TEXT NOT NULL,
+                beatmaps TEXT NOT NULL
+            )
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._connection.commit()
+        self._connection.close()
+
+    def get_song_record(self, simfile_filepath, file_format, simfile_stat):
+        row = self._connection.execute(
+            'SELECT header_data, beatmaps FROM songs WHERE simfile_filepath = ? AND file_format = ? AND mtime_ns = ? AND size = ?',
+            (simfile_filepath, file_format, simfile_stat.st_mtime_ns, simfile_stat.st_size),
+        ).fetchone()
+        if not row:
+            return None
+        header_data, beatmaps = row
+        return {'header_data': json.loads(header_data), 'beatmaps': json.loads(beatmaps)}
+
+    def add_song_record(self, simfile_filepath, file_format, simfile_stat, song_record):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                simfile_filepath,
+                file_format,
+                simfile_stat.st_mtime_ns,
+                simfile_stat.st_size,
+                json.dumps(song_record['header_data']),
+                json.dumps(song_record['beatmaps']),
+            ),
+        )
+
+    def remove_songs_not_in(self, song_folder_filepath, simfile_filepaths):
+        indexed_simfile_filepaths = [simfile_filepath for (simfile_filepath,) in self._connection.execute('SELECT simfile_filepath FROM songs')]
+        removed_simfile_filepaths = set(filter(lambda simfile_filepath: os.path.dirname(os.path.dirname(simfile_filepath)) == song_folder_filepath, indexed_simfile_filepaths)) - set(simfile_filepaths)
+        self._connection.executemany('DELETE FROM songs WHERE simfile_filepath = ?', [(simfile_filepath,) for simfile_filepath in removed_simfile_filepaths])
+
+song_library = SongLibrary(SONG_MAIN_DIR_NAME)
+
 ################
 # SONG LIST END
 ################
@@ -815,6 +2499,13 @@ def get_song(song_dir_filepath):
 ################
 
 PICK_INDICATOR = '=>'
+CHART_RENDERER_ENV_VAR = 'DDR_RENDERER' # One of [CHART_RENDERER_CLASSES]
+WINDOW_BACKEND_ENV_VAR = 'DDR_BACKEND' # One of [DDR_WINDOW_CLASSES]
+DDR_WINDOW_CLASSES = {
+    'glut': GlutDDRWindow,
+    'pygame': PygameDDRWindow,
+}
+WINDOW_BACKEND_DEFAULT = 'glut'
 
 def full_select_beatmap():
     song_selected, song_selected_music_filepath = select_song()
@@ -825,6 +2516,43 @@ def full_select_beatmap():
         return full_select_beatmap()
 
 def main():
+    argument_parser = argparse.ArgumentParser(description='Plays a chart along with its music. Songs are chosen from menus, unless a simfile (or a pack and a song) is given.')
+    argument_parser.add_argument('simfile', nargs='?', help='.ssc or .sm simfile, or the song directory containing it')
+    argument_parser.add_argument('--pack', help=f'song pack directory, in "{SONG_MAIN_DIR_NAME}"')
+    argument_parser.add_argument('--song', help='song directory, in the song pack')
+    argument_parser.add_argument('--difficulty', type=int, help='index among the charts sorted by difficulty, hardest by default')
+    argument_parser.add_argument('--speed', type=int, choices=MEASURE_HEIGHT_OPTIONS, help=f'measure height, {MEASURE_HEIGHT_OPTIONS[MEASURE_HEIGHT_DEFAULT_INDEX]} by default')
+    argument_parser.add_argument('--backend', default=os.environ.get(WINDOW_BACKEND_ENV_VAR) or WINDOW_BACKEND_DEFAULT, help=f'one of: {", ".join(DDR_WINDOW_CLASSES)} (or set {WINDOW_BACKEND_ENV_VAR})')
+    argument_parser.add_argument('--renderer', default=os.environ.get(CHART_RENDERER_ENV_VAR) or CHART_RENDERER_DEFAULT, help=f'one of: {", ".join(CHART_RENDERER_CLASSES)}, for the glut backend (or set {CHART_RENDERER_ENV_VAR})')
+    argument_parser.add_argument('--start', action='store_true', help='start the song as soon as the chart is loaded')
+    argument_parser.add_argument('--quit-after-first-frame', action='store_true', help='quit once the chart is drawn, to measure the startup time')
+    arguments = argument_parser.parse_args()
+
+    # Checked here rather than through [choices], since the defaults come from environment variables
+    chart_renderer_name = arguments.renderer
+    if chart_renderer_name not in CHART_RENDERER_CLASSES:
+        print(f'⚠️ Unknown renderer "{chart_renderer_name}", expected one of: {", ".join(CHART_RENDERER_CLASSES)}')
+        return
+    window_backend_name = arguments.backend
+    if window_backend_name not in DDR_WINDOW_CLASSES:
+        print(f'⚠️ Unknown backend "{window_backend_name}", expected one of: {", ".join(DDR_WINDOW_CLASSES)}')
+        return
+    window_kwargs = dict(start_when_loaded=arguments.start, quit_after_first_frame=arguments.quit_after_first_frame)
+    if window_backend_name == 'glut': # Only GLUT windows draw with OpenGL
+        window_kwargs['chart_renderer_name'] = chart_renderer_name
+
+    if arguments.simfile and (arguments.pack or arguments.song):
+        argument_parser.error('either a simfile or --pack and --song can be given, not both')
+    if bool(arguments.pack) != bool(arguments.song):
+        argument_parser.error('--pack and --song have to be given together')
+    if arguments.simfile or arguments.pack:
+        play_directly(arguments.simfile or os.path.join(SONG_MAIN_DIR_NAME, arguments.pack, arguments.song), arguments.difficulty, arguments.speed, window_backend_name, window_kwargs)
+        return
+    if arguments.difficulty is not None or arguments.speed is not None:
+        argument_parser.error('--difficulty and --speed need a simfile, or --pack and --song')
+
+    import pick # Only needed by the menus
+
     song_folder_selected = None
     song_selected = None
     song_selected_music_filepath = None
@@ -858,7 +2586,8 @@ def main():
         nonlocal song_selected
         beatmap_list = song_selected.ddr_beatmap_list()
         beatmap_displayed_options = [beatmap.displayed_difficulty() for beatmap in beatmap_list]
-        _, beatmap_selected_index = pick.pick(options=beatmap_displayed_options + ['<Back>'], title='Choose difficulty...', indicator=PICK_INDICATOR)
+        beatmap_displayed_options_with_analytics = [f'{displayed_difficulty} | {beatmap.displayed_analytics()}' if beatmap.analytics() else displayed_difficulty for displayed_difficulty, beatmap in zip(beatmap_displayed_options, beatmap_list)]
+        _, beatmap_selected_index = pick.pick(options=beatmap_displayed_options_with_analytics + ['<Back>'], title='Choose difficulty...', indicator=PICK_INDICATOR)
         if beatmap_selected_index == len(beatmap_list): # <Back>
             nonlocal song_selected_music_filepath
             nonlocal song_custom_offset_filepath
@@ -893,7 +2622,28 @@ def main():
     assert(song_folder_selected and song_selected and song_selected_music_filepath and song_custom_offset_filepath and beatmap_selected and measure_height_selected)
 
     print(f'🎵 {song_selected.displayed_name()} | {beatmap_selected.displayed_difficulty()}')
-    ddr_window = DDRWindow(song=song_selected, beatmap=beatmap_selected, measure_height_selected=measure_height_selected, song_music_filepath=song_selected_music_filepath, song_custom_offset_filepath=song_custom_offset_filepath)
+    ddr_window = DDR_WINDOW_CLASSES[window_backend_name](song=song_selected, beatmap=beatmap_selected, measure_height_selected=measure_height_selected, song_music_filepath=song_selected_music_filepath, song_custom_offset_filepath=song_custom_offset_filepath, **window_kwargs)
+    ddr_window.start_main_loop()
+
+# Skips the menus, and the scan of the song library along with them
+def play_directly(simfile_or_song_dir_filepath, difficulty_index, measure_height, window_backend_name, window_kwargs):
+    song_with_filepaths = get_song_with_filepaths(simfile_or_song_dir_filepath) if os.path.exists(simfile_or_song_dir_filepath) else None
+    if not song_with_filepaths:
+        print(f'⚠️ No .ssc/.sm simfile found at "{simfile_or_song_dir_filepath}"')
+        return
+    song, song_music_filepath, song_custom_offset_filepath = song_with_filepaths
+    if not os.path.exists(song_music_filepath):
+        print(f'⚠️ Could not play "{song.displayed_name()}" because it is missing the music file')
+        return
+    beatmap_list = song.ddr_beatmap_list()
+    difficulty_index = -1 if difficulty_index is None else difficulty_index
+    if not -len(beatmap_list) <= difficulty_index < len(beatmap_list):
+        print(f'⚠️ No difficulty {difficulty_index} for "{song.displayed_name()}", which has {len(beatmap_list)}: {", ".join(beatmap.displayed_difficulty() for beatmap in beatmap_list)}')
+        return
+    beatmap = beatmap_list[difficulty_index] # Notes that cannot be parsed are reported by the chart layout loader
+
+    print(f'🎵 {song.displayed_name()} | {beatmap.displayed_difficulty()}')
+    ddr_window = DDR_WINDOW_CLASSES[window_backend_name](song=song, beatmap=beatmap, measure_height_selected=measure_height or MEASURE_HEIGHT_OPTIONS[MEASURE_HEIGHT_DEFAULT_INDEX], song_music_filepath=song_music_filepath, song_custom_offset_filepath=song_custom_offset_filepath, **window_kwargs)
     ddr_window.start_main_loop()
 
 ################
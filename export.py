@@ -0,0 +1,163 @@
+import argparse
+import collections
+import concurrent.futures
+import math
+import multiprocessing
+import multiprocessing.shared_memory
+import numpy
+import os
+import shutil
+import struct
+import subprocess
+import time
+import zlib
+
+import ddr
+
+################
+# EXPORT START
+################
+
+EXPORT_FPS_DEFAULT = 60
+EXPORT_CHUNK_FRAME_COUNT = 10 # Frames rendered by a worker per task
+EXPORT_PENDING_CHUNKS_PER_PROCESS = 2 # Bounds how many rendered frames wait in memory for the encoder
+EXPORT_END_MARGIN_SECONDS = 2
+EXPORT_VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.mov', '.webm']
+EXPORT_FRAME_FILENAME_FORMAT = 'frame_{:06d}.png'
+EXPORT_PNG_COMPRESSION_LEVEL = 1 # Frames are mostly black, so higher levels barely shrink them but take several times longer
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Every worker process renders into its own headless GL context
+export_worker_chart_renderer = None
+
+def init_export_worker(simfile_filepath, file_format, beatmap_index, measure_height, chart_renderer_name, width, height):
+    global export_worker_chart_renderer
+    ddr.create_headless_gl_context(width, height)
+    song = ddr.parse_simfile(simfile_filepath, file_format, lazy_notes=True)
+    beatmap = song.ddr_beatmap_list()[beatmap_index]
+    export_worker_chart_renderer = ddr.CHART_RENDERER_CLASSES[chart_renderer_name](ddr.get_chart_layout(song, beatmap), measure_height=measure_height, display_width=width, display_height=height)
+
+# Frames are written straight into shared memory, since sending them back through the process pool would copy
+# every frame several more times
+def render_frames_to_shared_memory(chart_times, width, height, shared_memory_name):
+    shared_memory = multiprocessing.shared_memory.SharedMemory(name=shared_memory_name)
+    frames = numpy.ndarray((len(chart_times), height, width, 3), dtype=numpy.uint8, buffer=shared_memory.buf)
+    for frame_index, chart_time in enumerate(chart_times):
+        export_worker_chart_renderer.render(chart_time)
+        frames[frame_index] = ddr.read_rgb_pixels(width, height)
+    del frames # The shared memory cannot be closed while it is still referenced
+    shared_memory.close()
+    return len(chart_times)
+
+def render_frames_to_images(first_frame_index, chart_times, width, height, output_dir_filepath):
+    for frame_index, chart_time in enumerate(chart_times, start=first_frame_index):
+        export_worker_chart_renderer.render(chart_time)
+        save_png(os.path.join(output_dir_filepath, EXPORT_FRAME_FILENAME_FORMAT.format(frame_index)), ddr.read_rgb_pixels(width, height))
+    return len(chart_times)
+
+# Minimal 8-bit RGB PNG writer, since the usual image libraries always compress at their slowest levels
+def save_png(filepath, rgb_pixels):
+    height, width, _ = rgb_pixels.shape
+    rows = numpy.zeros((height, 1 + width * 3), dtype=numpy.uint8) # Every row starts with filter type 0 (none)
+    rows[:, 1:] = rgb_pixels.reshape(height, width * 3)
+    with open(filepath, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        write_png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) # 8 bits per channel, RGB
+        write_png_chunk(f, b'IDAT', zlib.compress(rows.tobytes(), EXPORT_PNG_COMPRESSION_LEVEL))
+        write_png_chunk(f, b'IEND', b'')
+
+def write_png_chunk(f, chunk_type, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+# The video starts when the music starts, so frame [i] shows the chart as it is displayed [i / fps] seconds into the song
+def export_chart(song_dir_filepath, beatmap_index, measure_height, chart_renderer_name, output_filepath, fps, process_count, width, height):
+    simfile_filepath_and_format = ddr.get_song_simfile(song_dir_filepath)
+    if not simfile_filepath_and_format:
+        print(f'⚠️ No simfile found in "{song_dir_filepath}"')
+        return
+    song = ddr.parse_simfile(*simfile_filepath_and_format, lazy_notes=True) # Beatmaps keep their simfile, which the chart layout cache is keyed on
+    beatmap = song.ddr_beatmap_list()[beatmap_index]
+    chart_layout = ddr.get_chart_layout(song, beatmap) # Also caches the layout for the workers
+    music_offset_seconds = ddr.get_music_offset_seconds(beatmap.music_offset(), song.music_offset(), ddr.get_custom_offset(os.path.join(song_dir_filepath, ddr.CUSTOM_OFFSET_FILENAME)))
+    duration_seconds = max(chart_layout.end_time_seconds() + music_offset_seconds, 0) + EXPORT_END_MARGIN_SECONDS
+    frame_count = math.ceil(duration_seconds * fps)
+    chart_times = numpy.arange(frame_count) / fps - music_offset_seconds
+    chunk_first_frame_indices = range(0, frame_count, EXPORT_CHUNK_FRAME_COUNT)
+    music_filepath = os.path.join(song_dir_filepath, song.music_filename())
+
+    print(f'⏳️ Exporting {frame_count} frames ({duration_seconds:.1f}s at {fps} fps) of "{beatmap.displayed_difficulty()}"...')
+    start_export_time = time.time()
+    # Forked workers would inherit the encoder's stdin and keep it open after it is closed here, so they are spawned
+    with concurrent.futures.ProcessPoolExecutor(max_workers=process_count, mp_context=multiprocessing.get_context('spawn'), initializer=init_export_worker, initargs=(*simfile_filepath_and_format, beatmap_index, measure_height, chart_renderer_name, width, height)) as process_pool:
+        if os.path.splitext(output_filepath)[1].lower() in EXPORT_VIDEO_EXTENSIONS:
+            if not shutil.which('ffmpeg'):
+                print('⚠️ ffmpeg is needed to export videos, export an image sequence by passing a directory instead')
+                return
+            encoder = subprocess.Popen(get_ffmpeg_arguments(output_filepath, fps, width, height, music_filepath if os.path.exists(music_filepath) else None), stdin=subprocess.PIPE)
+            encode_frames(process_pool, process_count, encoder, chart_times, chunk_first_frame_indices, width, height)
+            encoder.stdin.close()
+            encoder.wait()
+        else:
+            os.makedirs(output_filepath, exist_ok=True)
+            futures = [process_pool.submit(render_frames_to_images, chunk_first_frame_index, chart_times[chunk_first_frame_index:chunk_first_frame_index + EXPORT_CHUNK_FRAME_COUNT], width, height, output_filepath) for chunk_first_frame_index in chunk_first_frame_indices]
+            for future in futures:
+                future.result()
+    end_export_time = time.time()
+    print(f'✅ Exported to {output_filepath} in {round(end_export_time-start_export_time, 1)}s ({duration_seconds / (end_export_time-start_export_time):.1f}x real time)')
+
+# Chunks are submitted as earlier ones are encoded, so a slow encoder does not leave every frame in memory. Every pending
+# chunk has its own frame buffer, which is reused once that chunk has been encoded.
+def encode_frames(process_pool, process_count, encoder, chart_times, chunk_first_frame_indices, width, height):
+    frame_size = width * height * 3
+    frame_buffers = [multiprocessing.shared_memory.SharedMemory(create=True, size=EXPORT_CHUNK_FRAME_COUNT * frame_size) for _ in range(process_count * EXPORT_PENDING_CHUNKS_PER_PROCESS)]
+    try:
+        pending_chunks = collections.deque()
+        for chunk_index, chunk_first_frame_index in enumerate(chunk_first_frame_indices):
+            if len(pending_chunks) == len(frame_buffers):
+                encode_chunk(encoder, *pending_chunks.popleft(), frame_size)
+            frame_buffer = frame_buffers[chunk_index % len(frame_buffers)]
+            pending_chunks.append((process_pool.submit(render_frames_to_shared_memory, chart_times[chunk_first_frame_index:chunk_first_frame_index + EXPORT_CHUNK_FRAME_COUNT], width, height, frame_buffer.name), frame_buffer))
+        while pending_chunks:
+            encode_chunk(encoder, *pending_chunks.popleft(), frame_size)
+    finally:
+        for frame_buffer in frame_buffers:
+            frame_buffer.close()
+            frame_buffer.unlink()
+
+def encode_chunk(encoder, chunk_future, frame_buffer, frame_size):
+    frame_count = chunk_future.result()
+    encoder.stdin.write(frame_buffer.buf[:frame_count * frame_size])
+
+def get_ffmpeg_arguments(output_filepath, fps, width, height, music_filepath):
+    ffmpeg_arguments = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+    if music_filepath:
+        ffmpeg_arguments += ['-i', music_filepath, '-map', '0:v', '-map', '1:a', '-shortest']
+    return ffmpeg_arguments + ['-pix_fmt', 'yuv420p', output_filepath]
+
+################
+# EXPORT END
+################
+
+################
+# MAIN START
+################
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Exports a chart to a video or an image sequence without a window, faster than real time.')
+    argument_parser.add_argument('song_dir', help='song directory containing the .ssc or .sm simfile')
+    argument_parser.add_argument('output', help='video file (' + ', '.join(EXPORT_VIDEO_EXTENSIONS) + ', needs ffmpeg) or directory for a PNG sequence')
+    argument_parser.add_argument('--difficulty', type=int, default=-1, help='index among the charts sorted by difficulty, hardest by default')
+    argument_parser.add_argument('--measure-height', type=int, choices=ddr.MEASURE_HEIGHT_OPTIONS, default=ddr.MEASURE_HEIGHT_OPTIONS[ddr.MEASURE_HEIGHT_DEFAULT_INDEX])
+    argument_parser.add_argument('--renderer', choices=list(ddr.CHART_RENDERER_CLASSES), default=ddr.CHART_RENDERER_DEFAULT)
+    argument_parser.add_argument('--fps', type=int, default=EXPORT_FPS_DEFAULT)
+    argument_parser.add_argument('--processes', type=int, default=os.cpu_count())
+    arguments = argument_parser.parse_args()
+
+    export_chart(arguments.song_dir, arguments.difficulty, arguments.measure_height, arguments.renderer, arguments.output, arguments.fps, arguments.processes, ddr.DISPLAY_WIDTH, ddr.DISPLAY_HEIGHT)
+
+################
+# MAIN END
+################